@@ -1,16 +1,143 @@
-from flask import Flask, render_template, request, flash
-from forms import NamerForm, WeatherForm, DynoForm, ConverterSlipForm, QuarterProForm, ContactForm
-from weather import weather
-from tire import tire
-
-from flask_bootstrap import Bootstrap
-# to use it like math.pi
-import math
-import email_validator
+import json
+import os
+from time import perf_counter
+
+from flask import (Flask, Response, render_template, request, flash, jsonify,
+                   stream_with_context, g)
+from engine import iter_run, simulate_run, DidNotConverge
+from metrics import Registry, CONTENT_TYPE
+from runguard import Watchdog, Busy
+from dispersion import dispersion
+from resultcache import ResultCache
+from converter import converter_slip
+from dyno import dragstrip_dyno
+from specs import VehicleSpec, RunConditions
+from atmosphere import (atmosphere, atmosphere_cache, PRESS_ALTIMETER,
+                        PRESS_BAROMETER)
 
 app = Flask(__name__)
-Bootstrap(app)
+# no template uses Flask-Bootstrap's base templates or helpers (the pages
+# link Bootstrap themselves), so it is only loaded when asked for
+if os.environ.get('FLASK_BOOTSTRAP'):
+  from flask_bootstrap import Bootstrap
+  Bootstrap(app)
 app.config['SECRET_KEY'] = "thisismysecretkey"
+app.config['ATMOSPHERE_CACHE_SIZE'] = 1024
+atmosphere_cache.resize(app.config['ATMOSPHERE_CACHE_SIZE'])
+app.config['API_MAX_BATCH'] = 1000
+app.config['API_MAX_DISPERSION'] = 20000
+# a dispersion study runs on the run guard's pool too, with more time
+app.config['API_DISPERSION_TIMEOUT'] = 10.0
+app.config['RESULT_CACHE_PATH'] = os.environ.get(
+  'RESULT_CACHE_PATH', os.path.join(app.instance_path, 'results.sqlite'))
+app.config['RESULT_CACHE_BYTES'] = 64 << 20
+
+
+def timed_simulate_run(vehicle, env, **options):
+  # simulate_run for the result cache, timing the runs that miss it
+  start = perf_counter()
+  result = simulate_run(vehicle, env, **options)
+  simulation_seconds.observe(perf_counter() - start)
+  simulation_steps.observe(result.steps)
+  return result
+
+
+result_cache = ResultCache(app.config['RESULT_CACHE_PATH'],
+                           app.config['RESULT_CACHE_BYTES'],
+                           timed_simulate_run)
+# simulations run off the request thread, with a pass budget and timeout
+app.config['RUN_WORKERS'] = 2
+app.config['RUN_QUEUE'] = 8
+app.config['RUN_TIMEOUT'] = 2.0
+app.config['RUN_MAX_PASSES'] = 20000
+# a stream is paced by its reader, so it gets longer, but holds a slot
+app.config['STREAM_TIMEOUT'] = 30.0
+run_guard = Watchdog(app.config['RUN_WORKERS'], app.config['RUN_QUEUE'],
+                     app.config['RUN_TIMEOUT'], app.config['RUN_MAX_PASSES'])
+
+# served at /metrics.  Under serve.py the workers share METRICS_DIR, and a
+# scrape of any one reports the totals of all of them; without it (the
+# development server) the counts are this process's
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR')
+metrics = Registry(app.config['METRICS_DIR'])
+request_seconds = metrics.histogram('rsa_request_duration_seconds',
+                                    'Request latency by route',
+                                    ('route', 'method'))
+requests_total = metrics.counter('rsa_requests_total',
+                                 'Requests by route and status',
+                                 ('route', 'method', 'status'))
+errors_total = metrics.counter('rsa_errors_total',
+                               'Errors by route and exception type',
+                               ('route', 'type'))
+simulation_seconds = metrics.histogram('rsa_simulation_duration_seconds',
+                                       'Quarter Pro runs, cache misses only')
+simulation_steps = metrics.histogram(
+  'rsa_simulation_steps', 'Integration steps per Quarter Pro run',
+  buckets=(100, 150, 200, 250, 300, 400, 600, 1000, 2000, 5000))
+
+
+def cache_counts(field):
+  # the counters themselves, not info(): the result cache's info() queries
+  # its database, and sync() reads these after every request
+  return lambda: [(('atmosphere', ), getattr(atmosphere_cache, field)),
+                  (('result', ), getattr(result_cache, field))]
+
+
+def hit_ratio(cache):
+  lookups = cache.hits + cache.misses
+  return cache.hits / lookups if lookups else 0.0
+
+
+metrics.gauge('rsa_cache_hits_total', 'Cache hits', cache_counts('hits'),
+              ('cache', ), 'counter')
+metrics.gauge('rsa_cache_misses_total', 'Cache misses', cache_counts('misses'),
+              ('cache', ), 'counter')
+metrics.gauge('rsa_cache_hit_ratio', 'Cache hits over lookups',
+              lambda: [(('atmosphere', ), hit_ratio(atmosphere_cache)),
+                       (('result', ), hit_ratio(result_cache))],
+              ('cache', ))
+metrics.gauge('rsa_runs_total', 'Guarded runs by outcome',
+              lambda: [((outcome, ), n)
+                       for outcome, n in run_guard.info()._asdict().items()
+                       if outcome != 'running'],
+              ('outcome', ), 'counter')
+metrics.gauge('rsa_runs_running', 'Guarded runs in progress',
+              lambda: run_guard.info().running)
+
+
+def route():
+  return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def count_error(e):
+  errors_total.inc(route(), type(e).__name__)
+
+
+@app.before_request
+def start_timer():
+  g.request_start = perf_counter()
+
+
+@app.after_request
+def record_request(response):
+  # streamed responses are timed to their first byte
+  start = g.pop('request_start', None)
+  if start is not None:
+    request_seconds.observe(perf_counter() - start, route(), request.method)
+  requests_total.inc(route(), request.method, str(response.status_code))
+  metrics.sync()
+  return response
+
+
+@app.teardown_request
+def record_exception(e):
+  if e is not None:
+    count_error(e)
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+  return Response(metrics.expose(), content_type=CONTENT_TYPE)
 
 
 @app.errorhandler(404)
@@ -25,6 +152,7 @@ def history():
 
 @app.route('/support')
 def support():
+  from forms import ContactForm
   form = ContactForm()
   return render_template('support.html', form=form)
 
@@ -41,6 +169,7 @@ def home():
 
 @app.route('/signup', methods=['GET', 'POST'])
 def register():
+  from forms import NamerForm
   name = None
   form = NamerForm()
 
@@ -55,638 +184,98 @@ def register():
 
 @app.route('/quarterpro', methods=['GET', 'POST'])
 def quarterpro():
+  from forms import QuarterProForm
+  TIMESLIP = [None] * 7
+  error = None
   form = QuarterProForm()
-  mTimer = False
-
-  # Weather code to get hpc
-  temperature = form.gc_Temperature.data
-  humidity = form.gc_Humidity.data
-  barometer = form.gc_Barometer.data
-  altimeter = form.gc_Altimeter.data
-  fuelsystem = int(form.gc_FuelSystem.data)
-
-  rho, hpc = weather(temperature, humidity, barometer, altimeter, fuelsystem)
-
-  # Initialize constants
-  Z5 = 3600 / 5280
-  JMin = -4
-  JMax = 2
-  K6 = 0.92
-  K61 = 1.08
-  AMin = 0.004
-  AX = 9.7
-  CMU = 0.03
-  CMUK = 0
-  TimeTol = 0.002
-  KV = 0.05 / Z5
-  K7 = 5.5
-  KP21 = 0
-  KP22 = 0
-  FRCT = 1.01
-
-  if form.gc_Weight.data > 800:
-    gc_BodyStyle = 1
-  else:
-    gc_BodyStyle = 8
-
-  # Initialize arrays
-  TIMESLIP = [0] * 8
-  TGR = [0] * 7
-  TGEff = [0] * 7
-  ShiftRPM = [0] * 7
-  xrpm = [0] * 12
-  yhp = [0] * 12
-  ztq = [0] * 12
-  DistToPrint = [0] * 10
-  MPHtoPrint = [0] * 3
-
-  # Read input data from form
-
-  gc_TransGR = [form[f'gc_TransGR_{i}'].data for i in range(1, 7)]
-  gc_EngineRPM = [form[f'gc_EngineRPM_{i}'].data for i in range(1, 12)]
-  gc_EngineHP = [form[f'gc_EngineHP_{i}'].data for i in range(1, 12)]
-  gc_EngineTQ = [form[f'gc_EngineTQ_{i}'].data for i in range(1, 12)]
-  gc_TransEff = [form[f'gc_TransEff_{i}'].data for i in range(1, 7)]
-  gc_ShiftRPM = [form[f'gc_ShiftRPM_{i}'].data for i in range(1, 7)]
-  gc_TransType = form.gc_TransType.data
-
-  # Loop through gear ratios and fill in arrays
-  NGR = 0
-  for i in range(1, 7):
-    if gc_TransGR[i - 1] is None:
-      break
-    NGR = i
-    TGR[i] = gc_TransGR[i - 1]
-    TGEff[i] = gc_TransEff[i - 1]
-    ShiftRPM[i] = gc_ShiftRPM[i - 1]
-
-  # Calculate clutch shift time
-  DTShift = 0.2  # Clutch shift time
-  if gc_TransType == 92:
-    DTShift = 0.25  # Converter shift time
-
-  # Loop through engine RPM values and fill in arrays
-  NHP = 0
-  gc_PeakHP = 1
-  for i in range(1, 12):
-    if gc_EngineRPM[i - 1] is None:
-      break
-    NHP = i
-    xrpm[i] = gc_EngineRPM[i - 1]
-    yhp[i] = gc_EngineHP[i - 1]
-    ztq[i] = gc_EngineTQ[i - 1]
-    if yhp[i] != None and yhp[i] > gc_PeakHP:
-      gc_PeakHP = yhp[i]
-
-  # Compute ftd
-  ftd = max(2 * form.gc_Rollout.data, 24)
-
-  # Compute ovradj
-  ovradj = max(form.gc_Overhang.data + 0.25 * ftd, 0.5 * ftd) / 12
-
-  # Compute DistToPrint
-  DistToPrint = [form.gc_Rollout.data / 12
-                 ] + [30, 60, 330, 594, 660, 1000, 1254, 1320]
-  if DistToPrint[0] == 0:
-    DistToPrint[0] = 1
-
-  # Compute MPHtoPrint
-  MPHtoPrint = [60 / Z5, 100 / Z5]
-
-  # Compute ShiftRPMTol
-  ShiftRPMTol = 10 if ShiftRPM[1] != None and ShiftRPM[1] <= 8000 else 20
-
-  gc_TrackTemp = form.gc_TrackTemp.data
-  if gc_TrackTemp > 100:
-    TrackTempEffect = 1 + 0.0000025 * abs(100 - gc_TrackTemp)**2.5
-  else:
-    TrackTempEffect = 1 + 0.000002 * abs(100 - gc_TrackTemp)**2.5
-  if TrackTempEffect > 1.04:
-    TrackTempEffect = 1.04
-  TireSlip = 1.02 + (form.gc_TractionIndex.data -
-                     1) * 0.005 + (TrackTempEffect - 1) * 3
-
-  # calc printout interval to fill screen
-  hpmax = 1
-  hpmax = (gc_PeakHP * form.gc_HPTQMult.data /
-           hpc) * TGEff[1] * form.gc_Efficiency.data / (form.gc_Slippage.data *
-                                                        TireSlip)
-  if hpmax < 0.00001:
-    hpmax = 1
-  ET = (TrackTempEffect**0.25) * (1.8 + 4.2 *
-                                  (hpmax / form.gc_Weight.data)**(-1 / 3))
-
-  kd = 33
-  if gc_BodyStyle == 8:
-    ET = 1.04 * ET
-    kd = kd - 1
-
-  TimePrintInc1 = [0.25, 0.5, 1, 2, 3, 4, 5, 10, 15, 20, 25, 30, 35, 40, 50]
-  for i in range(0, 15):
-    z = ET / TimePrintInc1[i] + 2 * (NGR - 1)
-    if z < kd:
-      TimePrint = TimePrintInc1[i]
-      TimePrintInc = TimePrintInc1[i]
-      break
-  if z > kd:
-    TimePrintInc = 100
-
-  #  CALCULATE STALL SPEED IF LAMBDA WAS INPUT
-  if form.gc_SlipStallRPM.data > 220:
-    Stall = form.gc_SlipStallRPM.data
-  else:
-    Stall = 0
-    atf = 1 / (1000 * form.gc_SlipStallRPM.data)
-    for k in range(2, NHP + 1):
-      k1 = k - 1
-      B = form.gc_HPTQMult.data * (ztq[k] - ztq[k1]) / (hpc *
-                                                        (xrpm[k] - xrpm[k1]))
-      c = form.gc_HPTQMult.data * ztq[k] / hpc - xrpm[k] * B
-      z = B**2 + 4 * atf * c
-      r1 = 0
-      r2 = 0
-
-      if z > 0:
-        z = math.sqrt(z)
-        r1 = (B + z) / (2 * atf)
-        r2 = (B - z) / (2 * atf)
-
-      if r1 < xrpm[k1] and k > 2:
-        r1 = 0
-      if r2 < xrpm[k1] and k > 2:
-        r2 = 0
-      if r1 > xrpm[k] and k < NHP:
-        r1 = 0
-      if r2 > xrpm[k] and k < NHP:
-        r2 = 0
-      if r1 > 0:
-        Stall = r1
-      if r2 > 0:
-        Stall = r2
-
-    Stall = round(Stall, 20)
-
-    if Stall < xrpm[1]:
-      Stall = xrpm[1]
-
-    if ShiftRPM[1] > 0 and Stall >= ShiftRPM[1]:
-      Stall = ShiftRPM[1] - 100
-
-    if gc_TransType == 92:
-      if form.gc_LaunchRPM.data > Stall:
-        Stall = form.gcLaunchRPM.data
-
-  # Initialize Various Constants line 995
-  DistTol = 0.005
-  iGear = 1
-  ShiftFlag = 0
-  iDist = 0
-  iMPH = 1
-  LAdd = 1
-  SaveTime = 0
-  L = 1
-  Time0 = 0
-  Gear = [0] * 60
-  AGS = [0] * 60
-  time = [0] * 60
-  EngRPM = [0] * 60
-  Vel = [0] * 60
-  Dist = [0] * 60
-  DSRPM = 0
-  gc = 32.174
-  Z6 = (60 / (2 * math.pi)) * 550
-
-  # calculate launch conditions at starting line (static)
-  EngRPM[L] = form.gc_LaunchRPM.data
-  Gear[L] = iGear
-  DownForce = form.gc_Weight.data
-
-  # Call TABY(xrpm(), yhp(), NHP, 1, EngRPM(L), HP)
-  HP = 1
-  HP = form.gc_HPTQMult.data * HP / hpc
-  HPSave = HP
-  TQ = Z6 * HP / EngRPM[L]
-  TQ = TQ * form.gc_TorqueMult.data * TGR[iGear] * TGEff[iGear]
-
-  WindFPS = math.sqrt(Vel[L]**2 + 2 * Vel[L] * (form.gc_WindSpeed.data / Z5) *
-                      math.cos(math.pi * form.gc_WindAngle.data / 180) +
-                      (form.gc_WindSpeed.data / Z5)**2)
-  q = math.copysign(rho * math.pow(abs(WindFPS), 2) / (2 * gc), WindFPS)
-
-  DragForce = CMU * form.gc_Weight.data + form.gc_DragCoef.data * form.gc_RefArea.data * q
-
-  TireDia = form.gc_TireDia.data
-
-  force = TQ * form.gc_GearRatio.data * form.gc_Efficiency.data / (
-    TireSlip * TireDia / 24) - DragForce
-
-  # estimate maximum acceleration from force and weight
-  if gc_TransType == 92:
-    Ags0 = 0.88 * force / form.gc_Weight.data  #assume 12% misc losses on initial hit of tire
-  else:
-    Ags0 = 0.96 * force / form.gc_Weight.data  #assume 4% misc losses on initial hit of tire
-  AgsMax = Ags0  #save AgsMax for print tolerance selection
-
-  # assume YCG is 3.75" above static rear axle centerline (to match Pro Stock)
-  gc_YCG = (TireDia / 2) + 3.75
-
-  TireGrowth, TireCirFt = tire(form.gc_TireWidth.data, TireDia, Vel[L], Ags0)
-  TireRadIn = 12 * TireCirFt / (2 * math.pi)
-  deltaFWT = (Ags0 * form.gc_Weight.data *
-              ((gc_YCG - TireRadIn) +
-               (FRCT / form.gc_Efficiency.data) * TireRadIn) +
-              DragForce * gc_YCG) / form.gc_Wheelbase.data
-
-  # calculate dynamic front weight and static rear weight for launch conditions
-  # set the required static front weight for perfect balance at launch
-  DynamicFWT = 0
-  gc_StaticFWt = deltaFWT + DynamicFWT
-
-  # estimate static rear weight = total weight - estimated static front weight
-  StaticRWT = DownForce - gc_StaticFWt
-  if StaticRWT < 0:
-    StaticRWT = form.gc_Weight.data
-
-  # calculate initial max tire force limit based on estimated static rear weight
-  CAXI = (1 -
-          (form.gc_TractionIndex.data - 1) * 0.01) / (TrackTempEffect**0.25)
-  CRTF = CAXI * AX * TireDia * (form.gc_TireWidth.data +
-                                1) * (0.92 + 0.08 * (StaticRWT / 1900)**2.15)
-
-  if gc_BodyStyle == 8:
-    CRTF = 0.5 * CRTF
-
-  AMAX = (CRTF - DragForce) / form.gc_Weight.data
-  SLIP = [0] * 60
-  SLIP[L] = 0
-  if Ags0 > AMAX:
-    Ags0 = AMAX
-    SLIP[L] = 1
-  if Ags0 < AMin:
-    Ags0 = AMin
-  AGS[L] = Ags0
-
-  # AddListLine   Not sure what this is doing exactly. line 1059
-
-  # select a time step to get about 15 calcs during the rollout distance
-  TSMax = DistToPrint[1] * 0.11 * (HP * form.gc_TorqueMult.data /
-                                   form.gc_Weight.data)**(-1 / 3)
-  TSMax = TSMax / 15
-  if TSMax < 0.005:
-    TSMax = 0.005
-  iDist = 1
-
-  loop = 1
-
-  while loop > 0:
-    if loop < 231:
-      #230 TOP OF LOOP FOR GEAR CHANGE
-      Shift2PrintTime = time[L] + DTShift
-      TimeStep = DTShift
-
-      #CALCULATE THE TOTAL CHASSIS INERTIA FOR THIS GEAR
-      ChassisPMI = form.gc_TiresPMI.data + form.gc_TransPMI.data * form.gc_GearRatio.data**2 * TGR[
-        iGear]**2
-
-      if L > 1:
-        loop = 250
-        continue
-
-    if loop < 239:
-      #240 TOP OF LOOP FOR VELOCITY STEP INCREMENT
-      TimeStep = TSMax * (AgsMax / Ags0)**4  #QProRxCode
-
-    if loop < 250:
-      #250
-      Jerk = 0  #jerk has units of g's per second
-      Work = time[L] - Time0
-      if Work > 0:
-        Jerk = (AGS[L] - Ags0) / Work
-      if Jerk < JMin:
-        Jerk = JMin
-      if Jerk > JMax:
-        Jerk = JMax
-
-      Vel0 = Vel[L]
-      Ags0 = AGS[L]
-      TireGrowth, TireCirFt = tire(form.gc_TireWidth.data, TireDia, Vel[L],
-                                   Ags0)
-      RPM0 = EngRPM[L]
-      Time0 = time[L]
-      if RPM0 == form.gc_LaunchRPM.data and Time0 == 0:
-        RPM0 = Stall
-        if form.gc_LaunchRPM.data < Stall:
-          Time0 = form.gc_EnginePMI.data * (Stall -
-                                            form.gc_LaunchRPM.data) / 250000
-      Dist0 = Dist[L]
-
-      #calc tire slip from traction index, track temp and downtrack location
-      Work = 0.005 * (form.gc_TractionIndex.data - 1) + 3 * (TrackTempEffect -
-                                                             1)
-      TireSlip = 1.02 + Work * (1 - (Dist0 / 1320)**2)
-
-      DSRPM0 = DSRPM
-      L = L + LAdd
-      Gear[L] = iGear
-      LAdd = 0
-
-      #SELECT NEXT VELOCITY TO MEET VARIOUS OBJECTIVES (ShiftFlag < 2)
-      Vel[L] = Vel0 + Ags0 * gc * TimeStep + Jerk * gc * TimeStep**2 / 2
-
-      if ShiftFlag == 2:
-        loop = 270
-        continue
-
-      # don't let TimeStep exceed K7 steps per TimePrintInc
-      print(TimePrintInc)
-      print(K7)
-      tmpchk = TimePrintInc / K7
-
-      if TimeStep > tmpchk:
-        TimeStep = TimePrintInc / K7
-
-      # don't let TimeStep exceed TimePrint
-      if TimeStep > (TimePrint - Time0):
-        TimeStep = TimePrint - Time0
-
-      # don't let TimeStep exceed 4.5 steps to distance print
-      if iDist > 1:
-        Work = ((DistToPrint[iDist] - DistToPrint[iDist - 1]) /
-                Vel0) / 4.5  #increased from 2.0 7/11/99
-        if TimeStep > Work:
-          TimeStep = Work
-
-      if TimeStep > 0.05:
-        TimeStep = 0.05  #reduced from .2 7/11/99
-
-      Vel[
-        L] = Vel0 + Ags0 * gc * TimeStep + Jerk * gc * TimeStep * TimeStep / 2
-
-      # don't let TimeStep exceed shift points
-      if Vel0 > 0 and RPM0 > Stall and iGear < NGR:
-        Work = Vel0 * (ShiftRPM[iGear] + 5) / RPM0
-        if Vel[L] > Work:
-          Vel[L] = Work
-          TimeStep = (Vel[L] - Vel0) / (Ags0 * gc)
-
-      # don't let TimeStep exceed distance print
-      DistStep = Dist0 + Vel0 * TimeStep + Ags0 * gc * TimeStep**2 / 2
-      if DistStep >= (DistToPrint[iDist] - DistTol):
-        Vel[L] = math.sqrt(Vel0**2 + 2 * Ags0 * gc *
-                           (DistToPrint[iDist] - Dist0))
-
-    if loop < 271:
-      #270
-      # ENTRY POINT FOR VELOCITY REVISION TO MATCH DISTANCE, TIME, OR SHIFT POINT PRINTS
-      VelSqrd = Vel[L]**2 - Vel0**2
-      DSRPM = TireSlip * Vel[L] * 60 / TireCirFt
-
-      if mTimer == True:
-        loop = 999  #Patrick - see QProRxCode for other tests
-        continue
-
-      #PERFORM CLUTCH AND CONVERTER CALCULATIONS
-      LockRPM = DSRPM * form.gc_GearRatio.data * TGR[iGear]
-      EngRPM[L] = form.gc_Slippage.data * LockRPM
-
-      if gc_TransType == 100:  #clutch
-        if EngRPM[L] < Stall:
-          if iGear == 1 or form.gc_LockUp.data == False:
-            EngRPM[L] = Stall
-        ClutchSlip = LockRPM / EngRPM[L]
-      else:
-        if iGear == 1 or form.gc_LockUp.data == False:  # non lock-up converter
-          zStall = Stall
-          SlipRatio = form.gc_Slippage.data * LockRPM / zStall
-
-          if L > 2:
-            if SlipRatio > 0.6:
-              zStall = zStall * (1 + (form.gc_Slippage.data - 1) *
-                                 (SlipRatio - 0.6) /
-                                 ((1 / form.gc_Slippage.data) - 0.6))
-            SlipRatio = form.gc_Slippage.data * LockRPM / zStall
-          ClutchSlip = 1 / form.gc_Slippage.data
-
-          if EngRPM[L] < zStall:
-            EngRPM[L] = zStall
-            Work = form.gc_TorqueMult.data - (form.gc_TorqueMult.data -
-                                              1) * SlipRatio
-            ClutchSlip = Work * LockRPM / zStall
-        else:  #lock-up converter
-          EngRPM[L] = 1.005 * LockRPM
-          ClutchSlip = LockRPM / EngRPM[L]
-
-      if ClutchSlip > 1:
-        ClutchSlip = 1
-
-      #Call TABY(xrpm(), yhp(), NHP, 1, EngRPM(L), HP) 'Patrick - 2nd order in QProRx
-
-      HP = form.gc_HPTQMult.data * HP / hpc
-      HPSave = HP
-      HP = HP * ClutchSlip
-
-      #CALCULATE DRAG FORCES (FRICTION, VISCOUS AND AERODYNAMIC)    'Patrick - QProRx includes prevailing wind speed
-      WindFPS = math.sqrt(Vel[L]**2 + 2 * Vel[L] *
-                          (form.gc_WindSpeed.data / Z5) *
-                          math.cos(math.pi * form.gc_WindAngle.data / 180) +
-                          (form.gc_WindSpeed.data / Z5)**2)
-      q = math.copysign(1, WindFPS) * rho * abs(WindFPS)**2 / (2 * gc)
-
-      #increase frontal area based on tire growth (crude method! - check QProRxCode Patrick)
-      if gc_BodyStyle == 8:
-        RefArea2 = form.gc_RefArea.data + (
-          (TireGrowth - 1) * TireDia / 2) * form.gc_TireWidth.data / 144
-      else:
-        RefArea2 = form.gc_RefArea.data + (
-          (TireGrowth - 1) * TireDia / 2) * (2 * form.gc_TireWidth.data) / 144
-
-      DownForce = form.gc_Weight.data + form.gc_LiftCoef.data * RefArea2 * q
-      cmu1 = CMU - (Dist0 / 1320) * CMUK
-      DragForce = cmu1 * DownForce + 0.0001 * DownForce * (
-        Z5 * Vel[L]) + form.gc_DragCoef.data * RefArea2 * q
-      DragHP = DragForce * Vel[L] / 550
-
-      #calculate dynamic weight on front tires
-      TireRadIn = 12 * TireCirFt / (2 * math.pi)
-      #FRCT should really be variable at this point, getting closer to 1 downtrack
-      deltaFWT = (Ags0 * form.gc_Weight.data *
-                  ((gc_YCG - TireRadIn) +
-                   (FRCT / form.gc_Efficiency.data) * TireRadIn) +
-                  DragForce * gc_YCG) / form.gc_Wheelbase.data
-      DynamicFWT = gc_StaticFWt - deltaFWT
-
-      #calculate wheelie bar weight
-      WheelBarWT = 0
-      if DynamicFWT < 0:
-        #assume 64" wheelie bar as required to keep dynamic front weight = 0
-        WheelBarWT = -DynamicFWT * form.gc_Wheelbase.data / 64
-        DynamicFWT = 0
-
-      #calculate dynamic force on rear tires
-      DynamicRWT = DownForce - DynamicFWT - WheelBarWT
-      if DynamicRWT < 0:
-        DynamicRWT = form.gc_Weight.data
-      #RWT(L) = dynamicRWT    'QProRxCode
-      CRTF = CAXI * AX * TireDia * (form.gc_TireWidth.data +
-                                    1) * (0.92 + 0.08 *
-                                          (DynamicRWT / 1900)**2.15)
-      if gc_BodyStyle == 8:
-        CRTF = 0.5 * CRTF
-
-      AMAX = ((CRTF / TireGrowth) - DragForce) / form.gc_Weight.data
-
-      #CALCULATE RESIDUAL HORSEPOWER AVAILABLE (limit to AMax)
-      HP = HP * TGEff[iGear] * form.gc_Efficiency.data / TireSlip
-      HP = HP - DragHP
-      PQWT = 550 * gc * HP / form.gc_Weight.data
-      AGS[L] = PQWT / (Vel[L] * gc)
-
-      SLIP[L] = 0
-      if AGS[L] > AMAX:
-        SLIP[L] = 1
-        PQWT = PQWT * (AMAX - (AGS[L] - AMAX)) / AGS[L]
-        AGS[L] = AMAX - (AGS[L] - AMAX)
-
-      if AGS[L] < AMin:
-        PQWT = PQWT * AMin / AGS[L]
-        AGS[L] = AMin
-      time[L] = VelSqrd / (2 * PQWT) + Time0
-
-      EngAccHP = form.gc_EnginePMI.data * EngRPM[L] * (EngRPM[L] - RPM0)
-
-      if EngAccHP < 0:
-        if form.gc_TransType == 100:
-          EngAccHP = KP21 * EngAccHP
-        else:
-          EngAccHP = KP22 * EngAccHP
-
-      ChasAccHP = ChassisPMI * DSRPM * (DSRPM - DSRPM0)
-
-      if ChasAccHP < 0:
-        ChasAccHP = 0
-
-      k = 0
-
-    if loop < 281:
-      #280 ITERATION TO CONVERGE INERTIA TRANSIENT check QProRxCode
-
-      k = k + 1
-      dtkl = time[L] - Time0
-      Work = (2 * math.pi / 60)**2 / (12 * 550 * dtkl)
-      HPEngPMI = EngAccHP * Work
-      HPChasPMI = ChasAccHP * Work
-
-      HP = (HPSave - HPEngPMI) * ClutchSlip
-      HP = ((HP * TGEff[iGear] * form.gc_Efficiency.data - HPChasPMI) /
-            TireSlip) - DragHP
-      PQWT = 550 * gc * HP / form.gc_Weight.data
-      AGS[L] = PQWT / (Vel[L] * gc)
-
-      #steady iteration progress by using jerk limits
-      # Stopping at code line 1256 (out of about 1500...)
-      #just to end things...
-      loop = 999
-
-    #if loop < 301:
-    #300
-
-    #if loop < 306:
-    #305
-
-    #if loop < 331:
-    #330
-
-    #if loop < 341:
-    #340
-
-    #if loop < 351:
-    #350
-
-    if loop == 999:
-      #calcoutputexit
-      break
-
-  # Stopping at code line 1140 (out of about 1500...)
 
   # validate
-  #if form.validate_on_submit():
+  if form.validate_on_submit():
+    try:
+      vehicle = VehicleSpec.from_form(form)
+      env = RunConditions.from_form(form)
+      TIMESLIP = run_guard.run(result_cache.run, vehicle, env).timeslip
+    except (ValueError, DidNotConverge, Busy) as e:
+      count_error(e)
+      error = str(e)
+    else:
+      # ET to 0.01 s and MPH to 0.1 like the printed time slip
+      TIMESLIP = [
+        round(t, 1 if i in (3, 6) else 2) for i, t in enumerate(TIMESLIP)
+      ]
 
   return render_template('quarterpro.html',
-                         sixty=rho,
-                         threethirty=hpc,
-                         eighth=ET,
-                         halfmph=gc_PeakHP,
-                         thousand=TrackTempEffect,
-                         quarter=TGEff[1],
+                         sixty=TIMESLIP[0],
+                         threethirty=TIMESLIP[1],
+                         eighth=TIMESLIP[2],
+                         halfmph=TIMESLIP[3],
+                         thousand=TIMESLIP[4],
+                         quarter=TIMESLIP[5],
                          fullmph=TIMESLIP[6],
+                         error=error,
                          form=form)
 
 
 @app.route('/converterslip', methods=['GET', 'POST'])
 def converterslip():
+  from forms import ConverterSlipForm
   convSlip = None
+  error = None
   form = ConverterSlipForm()
 
   # validate
   if form.validate_on_submit():
-    TireDia = form.gc_TireDiameter.data
-    TireWidth = 0.33 * TireDia
-    gc_GearRatio = form.gc_GearRatio.data
-    gc_RPM = form.gc_RPM.data
-    gc_MPH = form.gc_MPH.data
-    TireWidthPow = TireWidth**1.4
-    TireDiaPow = TireDia**1.7
-    TireGrowthmDenom = 0.171 * TireDiaPow
-    TireGrowthmTop = TireWidthPow + TireDia
-    TireGrowthmTop = TireGrowthmTop - 16
-    TireGrowthm = TireGrowthmTop / TireGrowthmDenom
-    VFPS = gc_MPH * (5280 / 3600)
-    TireGrowth = 1 + TireGrowthm * 0.0000135 * VFPS**(1.6)
-    TireGrowthLinear = 1 + TireGrowthm * 0.000325 * VFPS
-    if TireGrowthLinear < TireGrowth:
-      TireGrowth = TireGrowthLinear
-    tsq = TireGrowth - 0.035 * abs(0.25)
-    TireCirc = tsq * TireDia * math.pi / 12
-    IdealMPH = (gc_RPM / gc_GearRatio) * TireCirc * (60 / 5280)
-    IdealMPH = IdealMPH / 1.005
-    ActualMPH = 1.006 * gc_MPH
-    convSlip = 100 * (IdealMPH / ActualMPH - 1)
-    convSlip = round(convSlip * 100) / 100
-
-  return render_template('converterslip.html', form=form, convSlip=convSlip)
+    try:
+      convSlip = converter_slip(form.gc_TireDiameter.data,
+                                form.gc_GearRatio.data, form.gc_RPM.data,
+                                form.gc_MPH.data)
+    except ValueError as e:
+      count_error(e)
+      error = str(e)
+    else:
+      convSlip = round(convSlip * 100) / 100
+
+  return render_template('converterslip.html', form=form, convSlip=convSlip,
+                         error=error)
 
 
 @app.route('/dragstripdyno', methods=['GET', 'POST'])
 def dragstripdyno():
+  from forms import DynoForm
   et_18 = None
   et_14 = None
   mph_18 = None
   mph_14 = None
+  error = None
   form = DynoForm()
 
   # validate
   if form.validate_on_submit():
-    TransEff = float(form.gc_TransType.data)
-    RaceEff = float(form.gc_RaceStyle.data)
-    gc_HP = form.gc_HP.data
-    gc_HPC = form.gc_HPC.data
-    gc_Weight = form.gc_Weight.data
-    HPQWT = ((TransEff / 100) * (RaceEff / 100) * gc_HP / gc_HPC) / gc_Weight
-    et_18 = round((1.05 + 2.84 * HPQWT**-0.34) * 1000) / 1000
-    mph_18 = round((10 + 180 * HPQWT**0.32) * 100) / 100
-    et_14 = round((1.05 + 4.83 * HPQWT**-0.33) * 1000) / 1000
-    mph_14 = round((10 + 227 * HPQWT**0.31) * 100) / 100
+    try:
+      dyno = dragstrip_dyno(form.gc_HP.data, form.gc_HPC.data,
+                            form.gc_Weight.data, form.gc_TransType.data,
+                            form.gc_RaceStyle.data)
+    except ValueError as e:
+      count_error(e)
+      error = str(e)
+    else:
+      et_18 = round(dyno.et_18 * 1000) / 1000
+      mph_18 = round(dyno.mph_18 * 100) / 100
+      et_14 = round(dyno.et_14 * 1000) / 1000
+      mph_14 = round(dyno.mph_14 * 100) / 100
 
   return render_template('dragstripdyno.html',
                          form=form,
                          et_18=et_18,
                          et_14=et_14,
                          mph_18=mph_18,
-                         mph_14=mph_14)
+                         mph_14=mph_14,
+                         error=error)
 
 
 @app.route('/weatherstation', methods=['GET', 'POST'])
 def weatherstation():
+  from forms import WeatherForm
   DALT = None
   HPC = None
   DNDX = None
@@ -696,53 +285,21 @@ def weatherstation():
   if form.validate_on_submit():
     temperature = form.gc_Temperature.data
     humidity = form.gc_Humidity.data
-    barometer = form.gc_Pressure.data
-    pressType = form.gc_PressType.data
-    altimeter = form.gc_Pressure.data
-    TSTD = 519.67
-    PSTD = 14.696
-    BSTD = 29.92
-    WTAIR = 28.9669
-    WTH20 = 18.016
-    RSTD = 1545.32
-    Z1 = 0.00356616
-    Z2 = 5.25588
-    cps1 = 0.0205558
-    cps2 = 0.00118163
-    cps3 = 0.0000154988
-    cps4 = 0.00000040245
-    cps5 = 0.000000000434856
-    cps6 = 0.00000000002096
-    Pexp = 1.0
-    Texp = 0.6
-    MechLoss = 0.15
-
-    if barometer < 1:
-      barometer = 1
-
-    PSDRY = cps1 + temperature * cps2 + pow(temperature, 2) * cps3 + pow(
-      temperature, 3) * cps4 + pow(temperature, 4) * cps5 + pow(
-        temperature, 5) * cps6
-    if pressType == '1':
-      PAMB = PSTD * ((TSTD - Z1 * altimeter) / TSTD)**Z2
+    pressure = form.gc_Pressure.data
+    pressType = int(form.gc_PressType.data)
+
+    if pressType == PRESS_ALTIMETER:
+      air = atmosphere_cache(temperature, humidity, gc_Elevation=pressure,
+                             gc_PressType=pressType)
     else:
-      PAMB = PSTD * barometer / BSTD
-    PWV = (humidity / 100) * PSDRY
-    PAIR = PAMB - PWV
-    Delta = PAIR / PSTD
-    WAR = (PWV * WTH20) / (PAIR * WTAIR)
-    Theta = (temperature + 459.67) / TSTD
-    RGAS = RSTD * ((1 / WTAIR) + (WAR / WTH20)) / (1 + WAR)
-    RGRS = RGAS / (RSTD / WTAIR)
-    ADI = 100 * Delta / Theta
-    DensAlt = (TSTD - TSTD * pow((ADI / 100), (1 / (Z2 - 1)))) / Z1
-    kWAR = 1 + 2.48 * pow(WAR, 1.5)
-    HPCor = Delta**Pexp / (RGRS**(0.5) * Theta**Texp)
-    HPCor = (1 + MechLoss) * kWAR / HPCor - MechLoss
-
-    HPC = round(HPCor, 3)
-    DALT = round(DensAlt, 0)
-    DNDX = round(ADI, 2)
+      if pressure < 1:
+        pressure = 1
+      air = atmosphere_cache(temperature, humidity, gc_Barometer=pressure,
+                             gc_PressType=pressType)
+
+    HPC = round(air.hpc, 3)
+    DALT = round(air.density_altitude, 0)
+    DNDX = round(air.adi, 2)
 
   return render_template('weather.html',
                          DALT=DALT,
@@ -751,14 +308,22 @@ def weatherstation():
                          form=form)
 
 
+@app.route('/weatherstation/cache')
+def weatherstation_cache():
+  # hit/miss/eviction counts for sizing ATMOSPHERE_CACHE_SIZE
+  return jsonify(atmosphere_cache.info()._asdict())
+
+
+@app.route('/quarterpro/cache')
+def quarterpro_cache():
+  # result cache counters, for checking the hit rate
+  return jsonify(result_cache.info()._asdict())
+
+
 @app.route("/test", methods=['POST', 'GET'])
 def index():
   #return render_template('home.html')
   if request.method == 'POST':
-
-    for key, value in request.form.items():
-      print(f'{key}: {value}')
-
     error = None
     result = None
     resultHPC = None
@@ -771,55 +336,20 @@ def index():
     gc_Barometer = request.form.get("gc_Barometer")
     gc_Temperature = request.form.get("gc_Temperature")
     gc_Humidity = request.form.get("gc_Humidity")
-    gc_PressType = request.form.get("gc_PressType")
+    gc_PressType = request.form.get("gc_PressType", PRESS_BAROMETER)
+    gc_Altimeter = request.form.get("gc_Altimeter") or 0
 
     try:
       barometer = float(gc_Barometer)
       temperature = float(gc_Temperature)
       humidity = float(gc_Humidity)
-      pressType = float(gc_PressType)
-      TSTD = 519.67
-      PSTD = 14.696
-      BSTD = 29.92
-      WTAIR = 28.9669
-      WTH20 = 18.016
-      RSTD = 1545.32
-      Z1 = 0.00356616
-      Z2 = 5.25588
-      Z3 = 0.00068
-      cps1 = 0.0205558
-      cps2 = 0.00118163
-      cps3 = 0.0000154988
-      cps4 = 0.00000040245
-      cps5 = 0.000000000434856
-      cps6 = 0.00000000002096
-      Pexp = 1.0
-      Texp = 0.6
-      MechLoss = 0.15
-
-      PSDRY = cps1 + temperature * cps2 + pow(temperature, 2) * cps3 + pow(
-        temperature, 3) * cps4 + pow(temperature, 4) * cps5 + pow(
-          temperature, 5) * cps6
-      PWV = (humidity / 100) * PSDRY
-      PAMB = PSTD * barometer / BSTD
-      PAIR = PAMB - PWV
-      Delta = PAIR / PSTD
-      WAR = (PWV * WTH20) / (PAIR * WTAIR)
-      Theta = (temperature + 459.67) / TSTD
-      RGAS = RSTD * ((1 / WTAIR) + (WAR / WTH20)) / (1 + WAR)
-      RGRS = RGAS / (RSTD / WTAIR)
-      ADI = 100 * Delta / Theta
-      DensAlt = (TSTD - TSTD * pow((ADI / 100), (1 / (Z2 - 1)))) / Z1
-      kWAR = 1 + 2.48 * pow(WAR, 1.5)
-      HPCor = Delta**Pexp / (RGRS**(0.5) * Theta**Texp)
-      HPCor = (1 + MechLoss) * kWAR / HPCor - MechLoss
-      resultHPC = round(HPCor, 3)
-      resultDA = round(DensAlt, 0)
-      resultADI = round(ADI, 2)
-      print(resultHPC)
-      print(resultDA)
-      print(resultADI)
-      print(pressType)
+      pressType = int(gc_PressType)
+      elevation = float(gc_Altimeter)
+      air = atmosphere_cache(temperature, humidity, barometer, elevation,
+                             gc_PressType=pressType)
+      resultHPC = round(air.hpc, 3)
+      resultDA = round(air.density_altitude, 0)
+      resultADI = round(air.adi, 2)
 
       return render_template('home.html',
                              resultHPC=resultHPC,
@@ -828,12 +358,14 @@ def index():
                              gc_Temperature=gc_Temperature,
                              calculation_success=True,
                              Debug=True)
-    except ZeroDivisionError:
+    except ZeroDivisionError as e:
+      count_error(e)
       return render_template('home.html',
                              calculation_success=False,
                              error="You cannot divide by zero")
 
-    except ValueError:
+    except ValueError as e:
+      count_error(e)
       return render_template(
         'home.html',
         calculation_success=False,
@@ -842,5 +374,182 @@ def index():
   return render_template('home.html', Debug=True)
 
 
+def api_batch(run, fields):
+  # JSON array of specs in, JSON array of {"result": ...} or {"error": ...}
+  # out, so one bad item does not fail the rest.  fields are the keys an
+  # item may have; any other is a 400 naming it
+  items = request.get_json(silent=True)
+  if not isinstance(items, list):
+    return jsonify(error='expected a JSON array of objects'), 400
+  if len(items) > app.config['API_MAX_BATCH']:
+    return jsonify(
+      error=f"at most {app.config['API_MAX_BATCH']} items per request"), 413
+  for i, item in enumerate(items):
+    for name in item if isinstance(item, dict) else ():
+      if name not in fields:
+        return jsonify(error=f'unknown field {name!r}', item=i, field=name,
+                       fields=list(fields)), 400
+
+  results = []
+  for item in items:
+    try:
+      if not isinstance(item, dict):
+        raise TypeError('each item must be a JSON object')
+      results.append({'result': run(**item)})
+    except DidNotConverge as e:
+      count_error(e)
+      results.append(dict(e.to_dict(), error=str(e)))
+    except Busy as e:
+      count_error(e)
+      results.append({'status': 'busy', 'error': str(e)})
+    except (TypeError, ValueError, ArithmeticError, IndexError) as e:
+      count_error(e)
+      results.append({'error': str(e)})
+  return jsonify(results)
+
+
+def scalars(item):
+  # atmosphere() takes arrays too, but its array results are not JSON
+  for name, value in item.items():
+    if isinstance(value, (list, dict)):
+      raise TypeError(f'{name} must be a number')
+  return item
+
+
+QUARTERPRO_FIELDS = ('vehicle', 'env', 'trace', 'adaptive', 'dense', 'marks',
+                     'mph_marks')
+WEATHER_FIELDS = ('gc_Temperature', 'gc_Humidity', 'gc_Barometer',
+                  'gc_Elevation', 'gc_FuelSystem', 'gc_PressType')
+DYNO_FIELDS = ('gc_HP', 'gc_HPC', 'gc_Weight', 'gc_TransType', 'gc_RaceStyle')
+CONVERTERSLIP_FIELDS = ('gc_TireDiameter', 'gc_GearRatio', 'gc_RPM', 'gc_MPH')
+
+
+def api_quarterpro_run(vehicle, env=None, trace=False, adaptive=False,
+                       dense=False, marks=(), mph_marks=()):
+  # adaptive=true is slower than the default on the reference DATs, see
+  # engine.simulate_run; the result's steps and passes show what it did
+  vehicle = VehicleSpec.from_dict(vehicle)
+  env = RunConditions.from_dict(env or {})
+  return run_guard.run(result_cache.run, vehicle, env,
+                       adaptive=bool(adaptive), dense=bool(dense),
+                       marks=[float(x) for x in marks],
+                       mph_marks=[float(x) for x in mph_marks]).to_dict(
+                         trace=trace)
+
+
+@app.route('/api/v1/quarterpro', methods=['POST'])
+def api_quarterpro():
+  return api_batch(api_quarterpro_run, QUARTERPRO_FIELDS)
+
+
+@app.route('/api/v1/quarterpro/stream', methods=['POST'])
+def api_quarterpro_stream():
+  # one run as NDJSON step records (or Server-Sent Events), then a result
+  # record; records are produced as the client reads them, so memory stays
+  # flat and a slow client simply slows the run down
+  item = request.get_json(silent=True)
+  if not isinstance(item, dict) or 'vehicle' not in item:
+    return jsonify(error='expected a JSON object with a vehicle'), 400
+  try:
+    vehicle = VehicleSpec.from_dict(item['vehicle'])
+    env = RunConditions.from_dict(item.get('env') or {})
+    every = int(item.get('every', 1))
+    if every < 1:
+      raise ValueError(f'every must be 1 or more, not {every!r}')
+  except (TypeError, ValueError) as e:
+    return jsonify(error=str(e)), 400
+  sse = (item.get('format') == 'sse' or
+         request.accept_mimetypes.best == 'text/event-stream')
+  # the run steps on this request's thread, but takes a run_guard slot so
+  # streams count against the same limit as pooled runs
+  try:
+    cancel, release = run_guard.hold(app.config['STREAM_TIMEOUT'])
+  except Busy as e:
+    count_error(e)
+    return jsonify(status='busy', error=str(e)), 503
+
+  def encode(kind, record):
+    if sse:
+      return f'event: {kind}\ndata: {json.dumps(record)}\n\n'
+    return json.dumps(dict(record, type=kind)) + '\n'
+
+  def generate():
+    run = iter_run(vehicle, env, adaptive=bool(item.get('adaptive')),
+                   dense=bool(item.get('dense')),
+                   max_passes=app.config['RUN_MAX_PASSES'], cancel=cancel)
+    try:
+      while True:
+        record = next(run)
+        # decimate plain steps; print rows are always sent
+        if record['event'] or record['step'] % every == 0:
+          yield encode('step', record)
+    except StopIteration as done:
+      yield encode('result', done.value.to_dict())
+    except DidNotConverge as e:
+      count_error(e)
+      yield encode('error', dict(e.to_dict(), error=str(e)))
+    except (ValueError, ArithmeticError, IndexError) as e:
+      count_error(e)
+      yield encode('error', {'error': str(e)})
+    finally:
+      release()
+
+  response = Response(
+    stream_with_context(generate()),
+    mimetype='text/event-stream' if sse else 'application/x-ndjson',
+    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+  # a client gone before the first record never starts generate()
+  response.call_on_close(release)
+  return response
+
+
+@app.route('/api/v1/quarterpro/dispersion', methods=['POST'])
+def api_quarterpro_dispersion():
+  # ET distribution over {"spread": {field: sd or [low, high]}}
+  item = request.get_json(silent=True)
+  if not isinstance(item, dict) or 'vehicle' not in item:
+    return jsonify(error='expected a JSON object with a vehicle'), 400
+  try:
+    vehicle = VehicleSpec.from_dict(item['vehicle'])
+    env = RunConditions.from_dict(item.get('env') or {})
+    spread = item.get('spread') or {}
+    if not isinstance(spread, dict):
+      raise TypeError('spread must be a JSON object')
+    max_n = min(int(item.get('max_n', app.config['API_MAX_DISPERSION'])),
+                app.config['API_MAX_DISPERSION'])
+    result = run_guard.run(dispersion, vehicle, env, spread,
+                           ci_width=float(item.get('ci_width', 0.002)),
+                           seed=item.get('seed'), max_n=max_n,
+                           timeout=app.config['API_DISPERSION_TIMEOUT'])
+  except DidNotConverge as e:
+    count_error(e)
+    return jsonify(dict(e.to_dict(), error=str(e))), 503
+  except Busy as e:
+    count_error(e)
+    return jsonify(status='busy', error=str(e)), 503
+  except (TypeError, ValueError, ArithmeticError, IndexError) as e:
+    count_error(e)
+    return jsonify(error=str(e)), 400
+  return jsonify(result.to_dict())
+
+
+@app.route('/api/v1/weather', methods=['POST'])
+def api_weather():
+  return api_batch(lambda **item: atmosphere(**scalars(item))._asdict(),
+                   WEATHER_FIELDS)
+
+
+@app.route('/api/v1/dyno', methods=['POST'])
+def api_dyno():
+  return api_batch(lambda **item: dragstrip_dyno(**item)._asdict(),
+                   DYNO_FIELDS)
+
+
+@app.route('/api/v1/converterslip', methods=['POST'])
+def api_converterslip():
+  return api_batch(lambda **item: {'convSlip': converter_slip(**item)},
+                   CONVERTERSLIP_FIELDS)
+
+
 if __name__ == "__main__":
   app.run(host='0.0.0.0', debug=True)
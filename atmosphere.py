@@ -0,0 +1,258 @@
+import math
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+TSTD = 519.67
+PSTD = 14.696
+BSTD = 29.92
+WTAIR = 28.9669
+WTH20 = 18.016
+RSTD = 1545.32
+Z1 = 0.00356616
+Z2 = 5.25588
+
+cps = [
+  0.0205558, 0.00118163, 0.0000154988, 0.00000040245, 0.000000000434856,
+  0.00000000002096
+]
+
+# gc_PressType: how the pressure inputs give ambient pressure
+PRESS_CORRECTED = 0  # barometer at elevation, as QUARTER Pro Weather
+PRESS_ALTIMETER = 1  # standard atmosphere at elevation (ft)
+PRESS_BAROMETER = 2  # absolute barometer (inHg)
+
+
+class Atmosphere(NamedTuple):
+  rho: float
+  hpc: float
+  density_altitude: float
+  adi: float
+
+
+def fuel_constants(gc_FuelSystem):
+  # set ifuel and icarb values
+  # ifuel:  1 = gas     2 = methanol    3 = nitro
+  # icarb:  1 = carb    2 = injector    3 = supercharger
+  ifuel, icarb = 0, 0
+  if gc_FuelSystem == 1:
+    ifuel = 1
+    icarb = 1
+  elif gc_FuelSystem == 2:
+    ifuel = 1
+    icarb = 2
+  elif gc_FuelSystem == 3:
+    ifuel = 2
+    icarb = 1
+  elif gc_FuelSystem == 4:
+    ifuel = 2
+    icarb = 2
+  elif gc_FuelSystem == 5:
+    ifuel = 3
+    icarb = 2
+  elif gc_FuelSystem == 6:
+    ifuel = 1
+    icarb = 3
+  elif gc_FuelSystem in [7, 9]:
+    ifuel = 2
+    icarb = 3
+  elif gc_FuelSystem == 8:
+    ifuel = 3
+    icarb = 3
+  else:
+    raise ValueError(f'gc_FuelSystem must be 1 - 9, not {gc_FuelSystem!r}')
+
+  if ifuel == 1:
+    px = 1
+    tx = 0.6
+    mech = 0.15
+  elif ifuel == 2:
+    px = 1
+    tx = 0.3
+    mech = 0.13
+  elif ifuel == 3:
+    px = 0.85
+    tx = 0.5
+    mech = 0.055
+
+  if icarb == 2:
+    mech -= 0.005
+
+  if icarb == 3:
+    px = 0.95
+    dtx = (1.35 - 1) / 1.35
+    dtx /= 0.85
+    px -= dtx * tx
+    tx += dtx
+    mech *= 0.6
+
+  return px, tx, mech
+
+
+def _apow(x, y):
+  # elementwise libm pow, the same call the scalar ** makes; numpy's SIMD
+  # power can differ from it in the last bit
+  import numpy as np
+  y = np.broadcast_to(y, x.shape)
+  return np.fromiter(map(math.pow, x.tolist(), y.tolist()), float, x.size)
+
+
+def _elevation_pow(elevation):
+  # ((TSTD - Z1 * elev) / TSTD) ** Z2 once per distinct elevation, since a
+  # weather log usually comes from one track
+  import numpy as np
+  if elevation.size and (elevation == elevation[0]).all():
+    elevs, inverse = elevation[:1], np.zeros(elevation.size, int)
+  else:
+    elevs, inverse = np.unique(elevation, return_inverse=True)
+  return _apow((TSTD - Z1 * elevs) / TSTD, Z2)[inverse.ravel()]
+
+
+def _kernel(T, RH, baro, elev_pow, px, tx, mech, gc_PressType, power, sqrt):
+  # partial pressure of dry air from relative humidity
+  psdry = cps[0] + T * (cps[1] + T * (cps[2] + T * (cps[3] + T *
+                                                    (cps[4] + T * cps[5]))))
+
+  PWV = (RH / 100) * psdry
+  if gc_PressType == PRESS_BAROMETER:
+    pamb = PSTD * baro / BSTD
+  elif gc_PressType == PRESS_ALTIMETER:
+    pamb = PSTD * elev_pow()
+  else:
+    pamb = (PSTD * baro / BSTD) * elev_pow()
+  pair = pamb - PWV
+  delta = pair / PSTD
+  WAR = (PWV * WTH20) / (pair * WTAIR)
+
+  # ambient air theta and density
+  theta = (T + 459.67) / TSTD
+  RGAS = RSTD * ((1 / WTAIR) + (WAR / WTH20)) / (1 + WAR)
+  rgrs = RGAS / (RSTD / WTAIR)
+  rho = 144 * pamb / (RGAS * (T + 459.67))
+
+  adi = 100 * delta / theta
+  dalt = (TSTD - TSTD * power(adi / 100, 1 / (Z2 - 1))) / Z1
+
+  # eliminate loss in thermal efficiency due to war
+  # from taylor, vol 1, page 431, fr=1.0 data
+  kwar = 1 + 2.48 * (WAR * sqrt(WAR))
+
+  hpc = power(delta, px) / (sqrt(rgrs) * power(theta, tx))
+  hpc = (1 + mech) * kwar / hpc - mech
+  return Atmosphere(rho, hpc, dalt, adi)
+
+
+def atmosphere(gc_Temperature,
+               gc_Humidity,
+               gc_Barometer=BSTD,
+               gc_Elevation=0,
+               gc_FuelSystem=1,
+               gc_PressType=PRESS_CORRECTED):
+  # rho, hpc, density altitude and ADI in one pass; any array argument
+  # gives arrays (bit for bit the scalar results), otherwise floats
+  gc_PressType = int(gc_PressType)
+  if gc_PressType not in (PRESS_CORRECTED, PRESS_ALTIMETER, PRESS_BAROMETER):
+    raise ValueError(f'gc_PressType must be 0 - 2, not {gc_PressType!r}')
+  inputs = (gc_Temperature, gc_Humidity, gc_Barometer, gc_Elevation,
+            gc_FuelSystem)
+
+  if not any(hasattr(x, '__len__') for x in inputs):
+    px, tx, mech = fuel_constants(gc_FuelSystem)
+    result = _kernel(
+      gc_Temperature, gc_Humidity, gc_Barometer,
+      lambda: ((TSTD - Z1 * gc_Elevation) / TSTD)**Z2, px, tx, mech,
+      gc_PressType, math.pow, math.sqrt)
+    if gc_FuelSystem == 9:
+      result = result._replace(hpc=1)
+    return result
+
+  import numpy as np
+  T, RH, baro, elev, fuel = np.broadcast_arrays(
+    *(np.asarray(x, float) for x in inputs))
+  shape = T.shape
+  T, RH, baro, elev, fuel = (a.ravel() for a in (T, RH, baro, elev, fuel))
+
+  # px/tx/mech per reading from the fuel system table
+  codes = fuel.astype(int)
+  bad = (codes != fuel) | (codes < 1) | (codes > 9)
+  if bad.any():
+    raise ValueError(
+      f'gc_FuelSystem must be 1 - 9, not {fuel[bad][0].item()!r}')
+  table = np.array([(0, 0, 0)] + [fuel_constants(i) for i in range(1, 10)],
+                   float)
+  px, tx, mech = table[codes].T
+
+  result = _kernel(T, RH, baro, lambda: _elevation_pow(elev), px, tx, mech,
+                   gc_PressType, _apow, np.sqrt)
+  result.hpc[codes == 9] = 1  # fuel system 9 is fixed at hpc = 1
+  return Atmosphere(*(a.reshape(shape) for a in result))
+
+
+class CacheInfo(NamedTuple):
+  hits: int
+  misses: int
+  evictions: int
+  maxsize: int
+  currsize: int
+
+
+class AtmosphereCache:
+  # LRU memo of atmosphere() with inputs rounded to instrument resolution:
+  # 0.1 F, 1 % RH, 0.01 inHg, 1 ft, so a hit returns exactly what
+  # atmosphere() gives for the rounded readings
+
+  def __init__(self, maxsize=1024):
+    self.maxsize = maxsize
+    self._data = OrderedDict()
+    self._lock = threading.Lock()
+    self.hits = self.misses = self.evictions = 0
+
+  @staticmethod
+  def key(gc_Temperature,
+          gc_Humidity,
+          gc_Barometer=BSTD,
+          gc_Elevation=0,
+          gc_FuelSystem=1,
+          gc_PressType=PRESS_CORRECTED):
+    return (round(float(gc_Temperature), 1), float(round(gc_Humidity)),
+            round(float(gc_Barometer), 2), float(round(gc_Elevation)),
+            int(gc_FuelSystem), int(gc_PressType))
+
+  def __call__(self, *args, **kwargs):
+    key = self.key(*args, **kwargs)
+    with self._lock:
+      result = self._data.get(key)
+      if result is not None:
+        self._data.move_to_end(key)
+        self.hits += 1
+        return result
+      self.misses += 1
+
+    result = atmosphere(*key)
+    with self._lock:
+      self._data[key] = result
+      self._evict()
+    return result
+
+  def _evict(self):
+    while len(self._data) > max(self.maxsize, 0):
+      self._data.popitem(last=False)
+      self.evictions += 1
+
+  def resize(self, maxsize):
+    with self._lock:
+      self.maxsize = maxsize
+      self._evict()
+
+  def info(self):
+    with self._lock:
+      return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize,
+                       len(self._data))
+
+  def clear(self):
+    with self._lock:
+      self._data.clear()
+      self.hits = self.misses = self.evictions = 0
+
+
+atmosphere_cache = AtmosphereCache()
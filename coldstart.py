@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import NamedTuple
+
+# a manual benchmark: times depend on the machine, so no baseline is kept
+# in the repo and nothing runs it automatically.  Save one with --save on
+# the machine you measure on, then compare later runs there with --check
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# route-specific dependencies that importing the app must not load; the
+# routes that need them import them on first use
+LAZY_MODULES = ('forms', 'flask_wtf', 'wtforms', 'email_validator',
+                'flask_bootstrap', 'numpy')
+PATHS = ('/', '/quarterpro')
+
+# run in a fresh interpreter: time the app import, then one request per
+# path through the test client
+_PROBE = r'''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+modules = sorted(sys.modules)
+client = app.app.test_client()
+first = {}
+for path in sys.argv[1:]:
+  tick = time.perf_counter()
+  client.get(path)
+  first[path] = time.perf_counter() - tick
+print(json.dumps({'import': imported - start, 'first': first,
+                  'modules': modules}))
+'''
+
+
+class StartupTimes(NamedTuple):
+  runs: int
+  # medians, seconds: interpreter start to exit, the app import alone, and
+  # each path's first request
+  process: float
+  imports: float
+  first_request: dict
+  # LAZY_MODULES the import loaded anyway
+  eager: tuple
+
+  def to_dict(self):
+    return self._asdict()
+
+
+def measure(runs=10, paths=PATHS):
+  """Cold start of the app, over runs fresh interpreters.
+
+  A first, untimed run writes the bytecode caches, so the times are
+  those of a deployment with compiled modules.
+  """
+  env = dict(os.environ)
+  env.pop('PYTHONDONTWRITEBYTECODE', None)
+  process, imports, first, eager = [], [], {path: [] for path in paths}, set()
+  for i in range(runs + 1):
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', _PROBE] + list(paths),
+                         cwd=HERE, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if out.returncode:
+      raise RuntimeError(f'app failed to start:\n{out.stderr}')
+    if i == 0:
+      continue
+    probe = json.loads(out.stdout.splitlines()[-1])
+    process.append(elapsed)
+    imports.append(probe['import'])
+    for path in paths:
+      first[path].append(probe['first'][path])
+    eager.update(set(LAZY_MODULES) & set(probe['modules']))
+  return StartupTimes(runs, statistics.median(process),
+                      statistics.median(imports),
+                      {path: statistics.median(t) for path, t in first.items()},
+                      tuple(sorted(eager)))
+
+
+def regressions(times, baseline, tolerance=0.25, slack=0.005):
+  # what got slower than baseline (a saved to_dict()) by more than
+  # tolerance plus slack seconds, and any module loaded eagerly
+  problems = [f'{name} loaded at import' for name in times.eager]
+
+  def check(label, now, then):
+    if then is not None and now > then * (1 + tolerance) + slack:
+      problems.append(
+        f'{label}: {now * 1000:.1f} ms, was {then * 1000:.1f} ms')
+
+  check('process', times.process, baseline.get('process'))
+  check('import', times.imports, baseline.get('imports'))
+  for path, t in times.first_request.items():
+    check(f'first {path}', t, baseline.get('first_request', {}).get(path))
+  return problems
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description='Measure the app cold start: import time and first-request '
+    'latency. A manual benchmark; baselines are per machine.')
+  parser.add_argument('--runs', type=int, default=10)
+  parser.add_argument('--path', action='append', dest='paths',
+                      help='first request to time (repeatable)')
+  parser.add_argument('--save', metavar='JSON',
+                      help='write the times as a baseline for this machine')
+  parser.add_argument('--check', metavar='JSON',
+                      help='fail on a regression against a baseline saved '
+                      'on this machine')
+  parser.add_argument('--tolerance', type=float, default=0.25)
+  args = parser.parse_args(argv)
+
+  times = measure(args.runs, tuple(args.paths or PATHS))
+  print(f'process: {times.process * 1000:.1f} ms')
+  print(f'import: {times.imports * 1000:.1f} ms')
+  for path, t in times.first_request.items():
+    print(f'first {path}: {t * 1000:.1f} ms')
+  if args.save:
+    with open(args.save, 'w') as f:
+      json.dump(times.to_dict(), f, indent=2)
+  baseline = {}
+  if args.check:
+    with open(args.check) as f:
+      baseline = json.load(f)
+  problems = regressions(times, baseline, args.tolerance)
+  for problem in problems:
+    print(f'regression: {problem}', file=sys.stderr)
+  if problems:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,82 @@
+import math
+
+
+def stall_speed(torque,
+                gc_SlipStallRPM,
+                hpc=1,
+                gc_HPTQMult=1,
+                ShiftRPM=0,
+                gc_TransType=92,
+                gc_LaunchRPM=0):
+  # CALCULATE STALL SPEED IF LAMBDA WAS INPUT (TIMESLIP.FRM), for every
+  # torque curve segment and every slip/stall input at once
+  # torque is an EngineCurve of engine torque; gc_SlipStallRPM may be an
+  # array, values above 220 are already a stall RPM and pass through
+  import numpy as np
+  slip = np.asarray(gc_SlipStallRPM, float)
+  if (slip <= 0).any():
+    raise ValueError('gc_SlipStallRPM must be greater than zero')
+  stall = slip.copy()
+  lam = slip <= 220
+  if not lam.any():
+    return stall if stall.ndim else float(stall)
+
+  # torque meets the converter absorption curve T = atf * rpm ** 2 where
+  # the quadratic atf * r**2 - B * r - c = 0 has a root inside the segment
+  xrpm = np.array(torque.rpm)
+  ztq = np.array(torque.values)
+  B = gc_HPTQMult * np.array(torque.slopes) / hpc
+  c = gc_HPTQMult * ztq[1:] / hpc - xrpm[1:] * B
+  atf = (1 / (1000 * slip[lam]))[:, None]
+  z = B**2 + 4 * atf * c
+  real = z > 0
+  z = np.sqrt(np.where(real, z, 0))
+  r1 = np.where(real, (B + z) / (2 * atf), 0)
+  r2 = np.where(real, (B - z) / (2 * atf), 0)
+
+  # roots outside the segment do not count, except below the first
+  # and above the last segment
+  nseg = len(B)
+  lo = np.where(np.arange(nseg) > 0, xrpm[:-1], -np.inf)
+  hi = np.where(np.arange(nseg) < nseg - 1, xrpm[1:], np.inf)
+  r1 = np.where((r1 < lo) | (r1 > hi), 0, r1)
+  r2 = np.where((r2 < lo) | (r2 > hi), 0, r2)
+
+  # the last segment with a root wins, r2 over r1
+  root = np.where(r2 > 0, r2, np.where(r1 > 0, r1, 0))
+  found = root > 0
+  last = nseg - 1 - np.argmax(found[:, ::-1], axis=1)
+  Stall = np.where(found.any(axis=1), root[np.arange(len(root)), last], 0)
+
+  Stall = np.maximum(Stall, xrpm[0])
+  if ShiftRPM > 0:
+    Stall = np.where(Stall >= ShiftRPM, ShiftRPM - 100, Stall)
+  if gc_TransType == 92:
+    Stall = np.maximum(Stall, gc_LaunchRPM)
+
+  stall[lam] = Stall
+  return stall if stall.ndim else float(stall)
+
+
+def converter_slip(gc_TireDiameter, gc_GearRatio, gc_RPM, gc_MPH):
+  # percent slip from finish line RPM and MPH
+  TireDia = gc_TireDiameter
+  if not TireDia > 0:
+    raise ValueError('tire diameter must be greater than zero')
+  if not gc_MPH > 0:
+    raise ValueError('MPH must be greater than zero')
+  if not gc_GearRatio > 0:
+    raise ValueError('gear ratio must be greater than zero')
+  TireWidth = 0.33 * TireDia
+  TireGrowthm = (TireWidth**1.4 + TireDia - 16) / (0.171 * TireDia**1.7)
+  VFPS = gc_MPH * (5280 / 3600)
+  TireGrowth = 1 + TireGrowthm * 0.0000135 * VFPS**(1.6)
+  TireGrowthLinear = 1 + TireGrowthm * 0.000325 * VFPS
+  if TireGrowthLinear < TireGrowth:
+    TireGrowth = TireGrowthLinear
+  tsq = TireGrowth - 0.035 * abs(0.25)
+  TireCirc = tsq * TireDia * math.pi / 12
+  IdealMPH = (gc_RPM / gc_GearRatio) * TireCirc * (60 / 5280)
+  IdealMPH = IdealMPH / 1.005
+  ActualMPH = 1.006 * gc_MPH
+  return 100 * (IdealMPH / ActualMPH - 1)
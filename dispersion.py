@@ -0,0 +1,171 @@
+from typing import NamedTuple
+
+from engine import simulate_run, DidNotConverge
+from ensemble import simulate_ensemble
+
+# RunConditions fields that may be dispersed, with the range they are
+# clipped to (the weather kernel needs temperatures above 0 F)
+LIMITS = {
+  'gc_Temperature': (0, 160),
+  'gc_Humidity': (0, 100),
+  'gc_Barometer': (20, 35),
+  'gc_Altimeter': (-2000, 15000),
+  'gc_WindSpeed': (0, 100),
+  'gc_WindAngle': (-360, 360),
+  'gc_TrackTemp': (-20, 200),
+  'gc_TractionIndex': (0, 10),
+}
+PERCENTILES = (1, 5, 10, 25, 50, 75, 90, 95, 99)
+Z95 = 1.959964
+
+
+class Dispersion(NamedTuple):
+  n: int
+  # samples whose run did not finish (diverged or hit its pass budget)
+  failed: int
+  converged: bool
+  # sampled RunConditions values, one array per dispersed field
+  samples: dict
+  # 1/4 mile ET and MPH per sample (NaN where the run did not finish)
+  et: object
+  mph: object
+  mean: float
+  std: float
+  # half width of the 95 % confidence interval on the mean ET
+  ci: float
+  percentiles: dict
+  histogram: tuple
+
+  def to_dict(self):
+    counts, edges = self.histogram
+    return {
+      'n': self.n,
+      'failed': self.failed,
+      'converged': self.converged,
+      'mean': self.mean,
+      'std': self.std,
+      'ci': self.ci,
+      'percentiles': self.percentiles,
+      'histogram': {'counts': counts.tolist(), 'edges': edges.tolist()},
+    }
+
+
+def _draw(rng, env, spread, n):
+  # n RunConditions around env; spread maps a field to a standard
+  # deviation (normal) or a (low, high) pair (uniform).  Every field takes
+  # the same draws whatever its kind, so equal seeds give equal samples
+  import numpy as np
+  names = sorted(spread)
+  for name in names:
+    if name not in LIMITS:
+      raise ValueError(f'{name} cannot be dispersed')
+  z = rng.standard_normal((n, len(names)))
+  u = rng.random((n, len(names)))
+  samples = {}
+  for j, name in enumerate(names):
+    how = spread[name]
+    if isinstance(how, (tuple, list)):
+      low, high = (float(x) for x in how)
+      values = low + (high - low) * u[:, j]
+    else:
+      values = getattr(env, name) + float(how) * z[:, j]
+    samples[name] = np.clip(values, *LIMITS[name])
+  envs = [
+    env.replace(**{name: float(samples[name][i]) for name in names})
+    for i in range(n)
+  ]
+  return envs, samples
+
+
+def _runs(vehicle, envs, exact, max_passes=100000):
+  # 1/4 mile ET and MPH per env
+  import numpy as np
+  if exact:
+    et = np.full(len(envs), np.nan)
+    mph = np.full(len(envs), np.nan)
+    for i, env in enumerate(envs):
+      # one sample that fails is a NaN, not the end of the study
+      try:
+        slip = simulate_run(vehicle, env, max_passes=max_passes).timeslip
+      except (DidNotConverge, ValueError):
+        continue
+      et[i], mph[i] = slip[5], slip[6]
+    bad = ~(et > 0)
+  else:
+    result = simulate_ensemble(vehicle, envs)
+    et = result.timeslip[:, 5].copy()
+    mph = result.timeslip[:, 6].copy()
+    bad = ~result.finished
+  et[bad] = np.nan
+  mph[bad] = np.nan
+  return et, mph
+
+
+def _sample(run, env, spread, ci_width, seed, batch, min_n, max_n, bins,
+            cancel=None):
+  # draw and run batches until the interval on the mean of run()'s first
+  # array is ci_width wide; cancel is looked at between batches
+  import numpy as np
+  rng = np.random.default_rng(seed)
+  parts = []
+  while True:
+    if cancel is not None and cancel.is_set():
+      raise DidNotConverge('cancelled')
+    envs, samples = _draw(rng, env, spread, batch)
+    parts.append((samples, ) + run(envs))
+    values = np.concatenate([p[1] for p in parts])
+    n = len(values)
+    ok = values[~np.isnan(values)]
+    if len(ok) > 1:
+      std = float(ok.std(ddof=1))
+      converged = n >= min_n and 2 * Z95 * std / len(ok)**0.5 <= ci_width
+    else:
+      converged = False
+    if converged or n >= max_n:
+      break
+  if len(ok) < 2:
+    raise ArithmeticError('too few runs finished to estimate a dispersion '
+                          f'({n - len(ok)} of {n} failed)')
+
+  samples = {name: np.concatenate([p[0][name] for p in parts])
+             for name in parts[0][0]}
+  mph = np.concatenate([p[2] for p in parts])
+  percentiles = dict(zip(PERCENTILES, np.percentile(ok, PERCENTILES).tolist()))
+  return Dispersion(n, n - len(ok), converged, samples, values, mph,
+                    float(ok.mean()), std, Z95 * std / len(ok)**0.5,
+                    percentiles, np.histogram(ok, bins))
+
+
+def dispersion(vehicle, env, spread, ci_width=0.002, seed=None, batch=256,
+               min_n=256, max_n=20000, bins=20, exact=False, cancel=None,
+               max_passes=100000):
+  """Distribution of the 1/4 mile ET over uncertain conditions.
+
+  spread maps RunConditions fields to a standard deviation about env's
+  value, or to a (low, high) range sampled uniformly.  Batches of samples
+  are run until the 95 % confidence interval on the mean ET is ci_width
+  seconds wide (or max_n runs).  Batches go through simulate_ensemble
+  unless exact=True, which runs each sample with simulate_run (and
+  max_passes).  Setting cancel, a threading.Event, stops the study after
+  the batch in progress with DidNotConverge, as under runguard.Watchdog.
+  """
+  return _sample(lambda envs: _runs(vehicle, envs, exact, max_passes), env,
+                 spread, ci_width, seed, batch, min_n, max_n, bins, cancel)
+
+
+def compare(vehicle_a, vehicle_b, env, spread, ci_width=0.002, seed=None,
+            batch=256, min_n=256, max_n=20000, bins=20, exact=False,
+            cancel=None, max_passes=100000):
+  """ET of vehicle_b minus vehicle_a over the same sampled conditions.
+
+  Both setups run on common random numbers, so the interval is on the
+  paired difference and narrows much faster than two separate runs would.
+  The returned Dispersion describes the differences.
+  """
+  def run(envs):
+    et_a, mph_a = _runs(vehicle_a, envs, exact, max_passes)
+    et_b, mph_b = _runs(vehicle_b, envs, exact, max_passes)
+    return et_b - et_a, mph_b - mph_a
+
+  return _sample(run, env, spread, ci_width, seed, batch, min_n, max_n, bins,
+                 cancel)
@@ -0,0 +1,23 @@
+from typing import NamedTuple
+
+
+class DynoResult(NamedTuple):
+  et_18: float
+  mph_18: float
+  et_14: float
+  mph_14: float
+
+
+def dragstrip_dyno(gc_HP,
+                   gc_HPC,
+                   gc_Weight,
+                   gc_TransType=92,
+                   gc_RaceStyle=100):
+  # 1/8 and 1/4 mile ET/MPH estimate from HP per weight
+  TransEff = float(gc_TransType)
+  RaceEff = float(gc_RaceStyle)
+  HPQWT = ((TransEff / 100) * (RaceEff / 100) * gc_HP / gc_HPC) / gc_Weight
+  if not HPQWT > 0:
+    raise ValueError('HP, HP correction and weight must be greater than zero')
+  return DynoResult(1.05 + 2.84 * HPQWT**-0.34, 10 + 180 * HPQWT**0.32,
+                    1.05 + 4.83 * HPQWT**-0.33, 10 + 227 * HPQWT**0.31)
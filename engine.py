@@ -0,0 +1,1150 @@
+import math
+from time import perf_counter
+from typing import NamedTuple
+
+from atmosphere import atmosphere_cache
+from tire import TireModel
+from enginecurve import EngineCurve
+from converter import stall_speed
+from tracebuf import TraceBuffer
+
+
+class PrintPoint(NamedTuple):
+  dist: float
+  time: float
+  mph: float
+  rpm: float
+  gear: int
+
+
+class Trace(NamedTuple):
+  # print table rows, as typed arrays
+  time: object
+  dist: object
+  vel: object
+  ags: object
+  slip: object
+  rpm: object
+  gear: object
+
+
+class Checkpoint(NamedTuple):
+  # integrator state at the top of a gear change (label 230) or after a
+  # print row (label 240), for resume=
+  label: int
+  gear: int
+  time: float
+  dist: float
+  steps: int
+  state: tuple
+
+
+class RunResult(NamedTuple):
+  rho: float
+  hpc: float
+  # TIMESLIP(1..7): 60', 330', 1/8, 1/8 MPH, 1000', 1/4, 1/4 MPH
+  timeslip: tuple
+  points: list
+  trace: Trace
+  steps: int = 0
+  # extra marks requested with marks= and mph_marks=, in time order
+  marks: tuple = ()
+  # integration passes of this call (not the resumed part): steps plus
+  # velocity revisions
+  passes: int = 0
+
+  def to_dict(self, trace=False):
+    result = {
+      'rho': self.rho,
+      'hpc': self.hpc,
+      'timeslip': list(self.timeslip),
+      'points': [p._asdict() for p in self.points],
+      'steps': self.steps,
+      'passes': self.passes,
+      'marks': [p._asdict() for p in self.marks],
+    }
+    if trace:
+      result['trace'] = {k: list(v) for k, v in self.trace._asdict().items()}
+    return result
+
+
+class DidNotConverge(ArithmeticError):
+  # a run stopped by its pass budget or a cancel, and how far it got
+
+  def __init__(self, reason, steps=0, time=0.0, dist=0.0):
+    super().__init__(f'did not converge: {reason} after {steps} steps '
+                     f'({dist:.1f} ft, {time:.3f} s)')
+    self.reason = reason
+    self.steps = steps
+    self.time = time
+    self.dist = dist
+
+  def to_dict(self):
+    return {
+      'status': 'did_not_converge',
+      'reason': self.reason,
+      'steps': self.steps,
+      'time': self.time,
+      'dist': self.dist,
+    }
+
+
+def simulate_run(vehicle, env, adaptive=False, time_tol=0.0003,
+                 dist_tol=0.0075, dense=False, marks=(), mph_marks=(),
+                 record=None, checkpoints=None, resume=None, max_passes=100000,
+                 cancel=None, profile=None):
+  """Run the Quarter Pro time slip for one vehicle and set of conditions.
+
+  vehicle is a specs.VehicleSpec and env a specs.RunConditions.  With
+  adaptive=True the TimeStep heuristics only set the smallest step: steps
+  grow past them while the local time and distance error of a step stays
+  under time_tol (seconds) and dist_tol (feet).  This is slower than the
+  default on the reference DATs (PROSTOCK 2.4 -> 3.2 ms, FUNNYCAR 3.7 ->
+  5.5 ms): the time prints cap step growth, so it saves few steps, and a
+  grown step that fails the error check is redone as extra passes.
+  RunResult.passes counts them next to RunResult.steps.
+
+  With dense=True distance prints and shift points are found inside the
+  step that passes them, on the step's constant power path, instead of by
+  shortening the step to land on them.  marks (feet) and mph_marks (MPH)
+  are extra points interpolated the same way, returned in RunResult.marks;
+  a mark at a print distance, up to and including the finish, is that
+  print row.
+
+  record, a tracebuf.TraceBuffer, receives the state at the end of every
+  step; print rows are passed as events so decimation keeps them.
+
+  checkpoints, a list, gets a Checkpoint at the start of every gear change
+  and after every print row.  resume=checkpoint carries on from one taken
+  by a run with the same inputs and options up to that point;
+  rerun.resume_point() picks the latest such checkpoint after an edit.
+
+  A run raises DidNotConverge after max_passes integration passes (steps
+  and velocity revisions), or once cancel, a threading.Event, is set; both
+  are checked every 64 passes.
+
+  profile, a runprofile.RunProfile, collects time and calls per phase of
+  the step loop, inertia iterations and TimeStep clamps.
+  """
+  run = iter_run(vehicle, env, adaptive, time_tol, dist_tol, dense, marks,
+                 mph_marks, record, checkpoints, resume, max_passes, cancel,
+                 profile, telemetry=False)
+  try:
+    while True:
+      next(run)
+  except StopIteration as done:
+    return done.value
+
+
+def iter_run(vehicle, env, adaptive=False, time_tol=0.0003, dist_tol=0.0075,
+             dense=False, marks=(), mph_marks=(), record=None,
+             checkpoints=None, resume=None, max_passes=100000, cancel=None,
+             profile=None, telemetry=True):
+  """simulate_run as a generator of step records.
+
+  Yields a dict for the launch and for the end of every step (nothing when
+  telemetry is False); the RunResult is the generator's return value.
+  """
+  prof = profile is not None
+  if prof:
+    tick = perf_counter()
+    Phase = 'setup'
+
+  # Read input data once; the integrator below only touches locals
+  gc_Weight = vehicle.gc_Weight
+  gc_Wheelbase = vehicle.gc_Wheelbase
+  gc_Rollout = vehicle.gc_Rollout
+  gc_Overhang = vehicle.gc_Overhang
+  gc_GearRatio = vehicle.gc_GearRatio
+  gc_Efficiency = vehicle.gc_Efficiency
+  gc_TireWidth = vehicle.gc_TireWidth
+  gc_HPTQMult = vehicle.gc_HPTQMult
+  gc_RefArea = vehicle.gc_RefArea
+  gc_DragCoef = vehicle.gc_DragCoef
+  gc_LiftCoef = vehicle.gc_LiftCoef
+  gc_TransType = vehicle.gc_TransType
+  gc_LaunchRPM = vehicle.gc_LaunchRPM
+  gc_SlipStallRPM = vehicle.gc_SlipStallRPM
+  gc_Slippage = vehicle.gc_Slippage
+  gc_LockUp = vehicle.gc_LockUp
+  gc_TorqueMult = vehicle.gc_TorqueMult
+  gc_EnginePMI = vehicle.gc_EnginePMI
+  gc_TransPMI = vehicle.gc_TransPMI
+  gc_TiresPMI = vehicle.gc_TiresPMI
+  gc_TractionIndex = env.gc_TractionIndex
+  gc_TrackTemp = env.gc_TrackTemp
+  TireDia = vehicle.gc_TireDia
+  WindFPS0 = env.gc_WindSpeed / (3600 / 5280)
+  WindCos = 2 * WindFPS0 * math.cos(math.pi * env.gc_WindAngle / 180)
+  WindSq = WindFPS0**2
+
+  # Weather code to get hpc
+  rho, hpc, _, _ = atmosphere_cache(env.gc_Temperature, env.gc_Humidity,
+                                    env.gc_Barometer, env.gc_Altimeter,
+                                    vehicle.gc_FuelSystem, env.gc_PressType)
+
+  # Initialize constants
+  Z5 = 3600 / 5280
+  JMin = -4
+  JMax = 2
+  K6 = 0.92
+  K61 = 1.08
+  AMin = 0.004
+  AX = 9.7
+  CMU = 0.03
+  CMUK = 0
+  TimeTol = 0.002
+  KV = 0.05 / Z5
+  K7 = 5.5
+  KP21 = 0
+  KP22 = 0
+  FRCT = 1.01
+  gc = 32.174
+  Z6 = (60 / (2 * math.pi)) * 550
+
+  if gc_Weight > 800:
+    gc_BodyStyle = 1
+  else:
+    gc_BodyStyle = 8
+
+  # Initialize 1-based arrays from the spec tables
+  TIMESLIP = [0] * 8
+  NGR = len(vehicle.gc_TransGR)
+  TGR = [0, *vehicle.gc_TransGR]
+  TGEff = [0, *vehicle.gc_TransEff]
+  ShiftRPM = [0, *vehicle.gc_ShiftRPM, 0][:NGR + 1]
+  gc_PeakHP = max(1, *vehicle.gc_EngineHP)
+  EngineHP = EngineCurve.hp(vehicle)
+
+  # Calculate clutch shift time
+  DTShift = 0.2  # Clutch shift time
+  if gc_TransType == 92:
+    DTShift = 0.25  # Converter shift time
+
+  # Compute ftd
+  ftd = max(2 * gc_Rollout, 24)
+
+  # Compute ovradj
+  ovradj = max(gc_Overhang + 0.25 * ftd, 0.5 * ftd) / 12
+
+  # Compute DistToPrint (1-based like the other arrays)
+  DistToPrint = [0, gc_Rollout / 12, 30, 60, 330, 594, 660, 1000, 1254, 1320]
+  if DistToPrint[1] == 0:
+    DistToPrint[1] = 1
+
+  # Compute MPHtoPrint
+  MPHtoPrint = [0, 60 / Z5, 100 / Z5]
+
+  # Compute ShiftRPMTol
+  ShiftRPMTol = 10 if ShiftRPM[1] <= 8000 else 20
+
+  if gc_TrackTemp > 100:
+    TrackTempEffect = 1 + 0.0000025 * abs(100 - gc_TrackTemp)**2.5
+  else:
+    TrackTempEffect = 1 + 0.000002 * abs(100 - gc_TrackTemp)**2.5
+  if TrackTempEffect > 1.04:
+    TrackTempEffect = 1.04
+  TireSlip = 1.02 + (gc_TractionIndex - 1) * 0.005 + (TrackTempEffect - 1) * 3
+
+  # calc printout interval to fill screen
+  hpmax = (gc_PeakHP * gc_HPTQMult / hpc) * TGEff[1] * gc_Efficiency / (
+    gc_Slippage * TireSlip)
+  if hpmax < 0.00001:
+    hpmax = 1
+  ET = (TrackTempEffect**0.25) * (1.8 + 4.2 * (hpmax / gc_Weight)**(-1 / 3))
+
+  kd = 33
+  if gc_BodyStyle == 8:
+    ET = 1.04 * ET
+    kd = kd - 1
+
+  TimePrintInc1 = [0.25, 0.5, 1, 2, 3, 4, 5, 10, 15, 20, 25, 30, 35, 40, 50]
+  for i in range(0, 15):
+    TimePrintInc = TimePrintInc1[i]
+    z = ET / TimePrintInc + 2 * (NGR - 1)
+    if z < kd:
+      break
+  if z > kd:
+    TimePrintInc = 100
+  TimePrint = TimePrintInc
+
+  #  CALCULATE STALL SPEED IF LAMBDA WAS INPUT
+  if gc_SlipStallRPM > 220:
+    Stall = gc_SlipStallRPM
+  else:
+    Stall = stall_speed(EngineCurve.torque(vehicle), gc_SlipStallRPM, hpc,
+                        gc_HPTQMult, ShiftRPM[1], gc_TransType, gc_LaunchRPM)
+
+  # Initialize Various Constants line 995
+  DistTol = 0.005
+  iGear = 1
+  ShiftFlag = 0
+  iDist = 0
+  iMPH = 1
+  LAdd = 1
+  SaveTime = 0
+  L = 1
+  Time0 = 0
+  rows = TraceBuffer()
+  time, Dist, Vel, AGS, SLIP, EngRPM, Gear = rows.columns
+  ASV = [0] * 8
+  points = {}
+  DSRPM = 0
+  steps = 0
+  MarkDist = sorted(marks)
+  MarkVel = sorted(mph / Z5 for mph in mph_marks)
+  MarkPoints = []
+
+  # calculate launch conditions at starting line (static)
+  EngRPM[L] = gc_LaunchRPM
+  Gear[L] = iGear
+  DownForce = gc_Weight
+
+  HP = EngineHP(EngRPM[L])
+  HP = gc_HPTQMult * HP / hpc
+  HPSave = HP
+  TQ = Z6 * HP / EngRPM[L]
+  TQ = TQ * gc_TorqueMult * TGR[iGear] * TGEff[iGear]
+
+  WindFPS = math.sqrt(Vel[L]**2 + Vel[L] * WindCos + WindSq)
+  q = math.copysign(rho * math.pow(abs(WindFPS), 2) / (2 * gc), WindFPS)
+
+  DragForce = CMU * gc_Weight + gc_DragCoef * gc_RefArea * q
+
+  force = TQ * gc_GearRatio * gc_Efficiency / (
+    TireSlip * TireDia / 24) - DragForce
+
+  # estimate maximum acceleration from force and weight
+  if gc_TransType == 92:
+    Ags0 = 0.88 * force / gc_Weight  #assume 12% misc losses on initial hit of tire
+  else:
+    Ags0 = 0.96 * force / gc_Weight  #assume 4% misc losses on initial hit of tire
+  AgsMax = Ags0  #save AgsMax for print tolerance selection
+
+  # assume YCG is 3.75" above static rear axle centerline (to match Pro Stock)
+  gc_YCG = (TireDia / 2) + 3.75
+
+  tires = TireModel(gc_TireWidth, TireDia)
+  TireGrowth, TireCirFt = tires(Vel[L], Ags0)
+  TireRadIn = 12 * TireCirFt / (2 * math.pi)
+  deltaFWT = (Ags0 * gc_Weight *
+              ((gc_YCG - TireRadIn) +
+               (FRCT / gc_Efficiency) * TireRadIn) +
+              DragForce * gc_YCG) / gc_Wheelbase
+
+  # calculate dynamic front weight and static rear weight for launch conditions
+  # set the required static front weight for perfect balance at launch
+  DynamicFWT = 0
+  gc_StaticFWt = deltaFWT + DynamicFWT
+
+  # estimate static rear weight = total weight - estimated static front weight
+  StaticRWT = DownForce - gc_StaticFWt
+  if StaticRWT < 0:
+    StaticRWT = gc_Weight
+  DynamicRWT = StaticRWT
+  WheelBarWT = 0
+  DragHP = 0
+
+  # calculate initial max tire force limit based on estimated static rear weight
+  CAXI = (1 -
+          (gc_TractionIndex - 1) * 0.01) / (TrackTempEffect**0.25)
+  CRTFK = CAXI * AX * TireDia * (gc_TireWidth + 1)
+  if gc_BodyStyle == 8:
+    CRTFK = 0.5 * CRTFK
+  CRTF = CRTFK * (0.92 + 0.08 * (StaticRWT / 1900)**2.15)
+
+  # per-run constants for the step loop
+  if gc_BodyStyle == 8:
+    RefAreaK = (TireDia / 2) * gc_TireWidth / 144
+  else:
+    RefAreaK = (TireDia / 2) * (2 * gc_TireWidth) / 144
+  ViscK = 0.0001 * Z5
+  PMIK = (2 * math.pi / 60)**2 / (12 * 550)
+  PQK = 550 * gc / gc_Weight
+
+  AMAX = (CRTF - DragForce) / gc_Weight
+  SLIP[L] = 0
+  if Ags0 > AMAX:
+    Ags0 = AMAX
+    SLIP[L] = 1
+  if Ags0 < AMin:
+    Ags0 = AMin
+  AGS[L] = Ags0
+
+  # select a time step to get about 15 calcs during the rollout distance
+  TSMax = DistToPrint[1] * 0.11 * (HP * gc_TorqueMult /
+                                   gc_Weight)**(-1 / 3)
+  TSMax = TSMax / 15
+  if TSMax < 0.005:
+    TSMax = 0.005
+  NextStep = TSMax
+  iDist = 1
+
+  def telemetry_record(step, event):
+    return {
+      'step': step,
+      'time': time[L],
+      'dist': Dist[L],
+      'mph': Vel[L] * Z5,
+      'ags': AGS[L],
+      'slip': SLIP[L],
+      'rpm': EngRPM[L],
+      'gear': Gear[L],
+      'rwt': DynamicRWT,
+      'wheelie_bar': WheelBarWT,
+      'drag_hp': DragHP,
+      'tire_growth': TireGrowth,
+      'event': event,
+    }
+
+  def rec(i, event):
+    if record is not None:
+      record.append((time[i], Dist[i], Vel[i], AGS[i], SLIP[i], EngRPM[i],
+                     Gear[i]), event)
+
+  def mark(iDist):
+    points[iDist] = PrintPoint(DistToPrint[iDist], time[L], Vel[L] * Z5,
+                               EngRPM[L], Gear[L])
+
+  def sub325(factor):
+    # COMMON INTERPOLATION AND PRINT
+    nonlocal L
+    factor = factor**0.7
+    AGS[L] = Ags0 + factor * (ASV[4] - Ags0)
+
+    SLIP[L] = 0
+    if SLIP[L - 1] == 1 and ASV[5] == 1:
+      SLIP[L] = 1
+
+    EngRPM[L] = RPM0 + factor * (ASV[6] - RPM0)
+    Gear[L] = ASV[7]
+
+    if Dist[L] == DistToPrint[iDist]:
+      mark(iDist)
+
+    if iDist < 9:
+      rec(L, True)
+      rows.reserve(L + 2)
+      L = L + 1
+      time[L] = ASV[1]
+      Dist[L] = ASV[2]
+      Vel[L] = ASV[3]
+      AGS[L] = ASV[4]
+      SLIP[L] = ASV[5]
+      EngRPM[L] = ASV[6]
+      Gear[L] = ASV[7]
+
+  def sub310(factor):
+    # DISTANCE INTERPOLATION
+    time[L] = Time0 + factor * (ASV[1] - Time0)
+    Dist[L] = DistToPrint[iDist]
+    Vel[L] = Vel0 + factor * (ASV[3] - Vel0)
+    subSlip()
+    sub325(factor)
+
+  def subSlip():
+    # TIMESLIP ENTRY FOR AN INTERPOLATED DISTANCE PRINT
+    nonlocal SaveTime
+    if iDist == 3:
+      TIMESLIP[1] = time[L]  # 60 ft
+    elif iDist == 4:
+      TIMESLIP[2] = time[L]  # 330 ft
+    elif iDist == 5:
+      SaveTime = time[L]  # 594 ft
+    elif iDist == 6:
+      TIMESLIP[3] = time[L]  # 660 ft
+      TIMESLIP[4] = Z5 * 66 / (TIMESLIP[3] - SaveTime)
+      SaveTime = 0
+    elif iDist == 7:
+      TIMESLIP[5] = time[L]  # 1000 ft
+    elif iDist == 8:
+      SaveTime = time[L]  # 1254 ft
+    elif iDist == 9:
+      TIMESLIP[6] = time[L]  # 1320 ft
+      TIMESLIP[7] = Z5 * 66 / (TIMESLIP[6] - SaveTime)
+      SaveTime = 0
+
+  def sub315(factor):
+    # TIME INTERPOLATION
+    time[L] = TimePrint
+    Dist[L] = Dist0 + factor * (ASV[2] - Dist0)
+    Vel[L] = Vel0 + factor * (ASV[3] - Vel0)
+    sub325(factor)
+
+  def sub320(factor):
+    # VELOCITY INTERPOLATION
+    time[L] = Time0 + factor * (ASV[1] - Time0)
+    Dist[L] = Dist0 + factor * (ASV[2] - Dist0)
+    Vel[L] = MPHtoPrint[iMPH]
+    sub325(factor)
+
+  def subDense():
+    # DENSE DISTANCE PRINT: the print on the step's constant power path,
+    # the end of the step moves on to the next row
+    nonlocal L, Time0, Dist0
+    ASV[1:] = time[L], Dist[L], Vel[L], AGS[L], SLIP[L], EngRPM[L], Gear[L]
+    Vel[L] = (3 * PQWT * (DistToPrint[iDist] - Dist0) + Vel0**3)**(1 / 3)
+    factor = (Vel[L] - Vel0) / (ASV[3] - Vel0)
+    time[L] = Time0 + (Vel[L]**2 - Vel0**2) / (2 * PQWT)
+    Dist[L] = DistToPrint[iDist]
+    AGS[L] = Ags0 + factor * (ASV[4] - Ags0)
+    EngRPM[L] = RPM0 + factor * (ASV[6] - RPM0)
+
+    if iDist == 1:
+      Work = time[L] if gc_Rollout > 0 else 0
+      time[L] = time[L] - Work
+      ASV[1] = ASV[1] - Work
+      Time0 = Time0 - Work
+      Dist[L] = Dist[L] + ovradj  #adjust for front overhang
+      ASV[2] = ASV[2] + ovradj
+      Dist0 = Dist0 + ovradj
+    subSlip()
+    mark(iDist)
+
+    if iDist == 9:
+      return
+    rec(L, True)
+    if not (iDist in (5, 8) or iDist == 1 and gc_Rollout == 0):
+      rows.reserve(L + 2)
+      L = L + 1
+    time[L], Dist[L], Vel[L], AGS[L], SLIP[L], EngRPM[L], Gear[L] = ASV[1:]
+
+  def subMarks(limit=None):
+    # EXTRA DISTANCE AND MPH MARKS passed during the step, on the step's
+    # constant power path (over a gear change linear, RPM as sub325 prints
+    # it); limit takes the distance marks up to there instead, for the
+    # finish the last step may stop short of
+    if iDist == 1 or Time0 < 0:
+      return
+    found = []
+    while MarkDist and MarkDist[0] <= (Dist[L] if limit is None else limit):
+      Work = MarkDist.pop(0)
+      if Work < Dist0:
+        continue
+      if ShiftFlag == 2:
+        factor = (Work - Dist0) / (Dist[L] - Dist0)
+        found.append((factor, Work, Vel0 + factor * (Vel[L] - Vel0)))
+      else:
+        found.append((None, Work, (3 * PQWT * (Work - Dist0) +
+                                   Vel0**3)**(1 / 3)))
+    while MarkVel and MarkVel[0] <= Vel[L]:
+      Work = MarkVel.pop(0)
+      if Work < Vel0:
+        continue
+      if ShiftFlag == 2:
+        factor = (Work - Vel0) / (Vel[L] - Vel0)
+        found.append((factor, Dist0 + factor * (Dist[L] - Dist0), Work))
+      else:
+        found.append((None, (Work**3 - Vel0**3) / (3 * PQWT) + Dist0, Work))
+
+    for factor, d, v in found:
+      if factor is None:
+        t = Time0 + (v**2 - Vel0**2) / (2 * PQWT)
+        factor = (v - Vel0) / (Vel[L] - Vel0)
+      else:
+        t = Time0 + factor * (time[L] - Time0)
+        factor = factor**0.7
+      MarkPoints.append(PrintPoint(d, t, v * Z5, RPM0 + factor *
+                                   (EngRPM[L] - RPM0), Gear[L]))
+
+  def snapshot(label):
+    # everything the loop carries past label 230 or 240
+    return Checkpoint(label, iGear, time[L], Dist[L], steps, (
+      (iGear, ShiftFlag, iDist, iMPH, LAdd, SaveTime, L, Time0, Ags0, DSRPM,
+       steps, TimePrint, DistTol, NextStep, DynamicRWT, WheelBarWT, DragHP,
+       ChassisPMI),
+      tuple(col[:L + 1] for col in rows.columns), tuple(ASV), dict(points),
+      tuple(TIMESLIP), tuple(MarkDist), tuple(MarkVel), tuple(MarkPoints)))
+
+  def doOpt():
+    # interpolate the prints passed over during a shift, earliest first
+    opts = []
+
+    if Dist[L] >= DistToPrint[iDist] + DistTol:
+      factor1 = (DistToPrint[iDist] - Dist0) / (ASV[2] - Dist0)
+      if 0 < factor1 < 1:
+        opts.append((factor1, 1, sub310))
+
+    if time[L] >= TimePrint + TimeTol:
+      factor2 = (TimePrint - Time0) / (ASV[1] - Time0)
+      if 0 < factor2 < 1:
+        opts.append((factor2, 2, sub315))
+
+    if iMPH <= 2:
+      if Vel[L] >= MPHtoPrint[iMPH] + KV:
+        factor3 = (MPHtoPrint[iMPH] - Vel0) / (ASV[3] - Vel0)
+        if 0 < factor3 < 1:
+          opts.append((factor3, 3, sub320))
+
+    # prints landing on the same factor are only interpolated once
+    opts.sort()
+    factor0 = None
+    for factor, _, sub in opts:
+      if factor != factor0:
+        sub(factor)
+        factor0 = factor
+
+  loop = 1
+  passes = 0
+  CheckPass = 64
+  if resume is not None:
+    ((iGear, ShiftFlag, iDist, iMPH, LAdd, SaveTime, L, Time0, Ags0, DSRPM,
+      steps, TimePrint, DistTol, NextStep, DynamicRWT, WheelBarWT, DragHP,
+      ChassisPMI),
+     columns, ASV[:], saved, TIMESLIP[:], MarkDist[:], MarkVel[:],
+     MarkPoints[:]) = resume.state
+    rows.reserve(L + 2)
+    for col, saved_col in zip(rows.columns, columns):
+      col[:L + 1] = saved_col
+    points.update(saved)
+    loop = resume.label
+
+  while loop > 0:
+    if loop <= 230:
+      #230 TOP OF LOOP FOR GEAR CHANGE
+      if prof:
+        tick = profile.lap(Phase, tick)
+        Phase = 'gear'
+      Shift2PrintTime = time[L] + DTShift
+      TimeStep = DTShift
+
+      #CALCULATE THE TOTAL CHASSIS INERTIA FOR THIS GEAR
+      ChassisPMI = gc_TiresPMI + gc_TransPMI * gc_GearRatio**2 * TGR[iGear]**2
+
+      if L > 1:
+        loop = 250
+        continue
+
+    if loop <= 240:
+      #240 TOP OF LOOP FOR VELOCITY STEP INCREMENT
+      TimeStep = TSMax * (AgsMax / Ags0)**4  #QProRxCode
+
+    if loop <= 250:
+      #250
+      if prof:
+        tick = profile.lap(Phase, tick)
+        Phase = 'step'
+      Jerk = 0  #jerk has units of g's per second
+      Work = time[L] - Time0
+      if Work > 0:
+        Jerk = (AGS[L] - Ags0) / Work
+      if Jerk < JMin:
+        Jerk = JMin
+      if Jerk > JMax:
+        Jerk = JMax
+
+      Vel0 = Vel[L]
+      Ags0 = AGS[L]
+      PQWT0 = Ags0 * gc * Vel0
+      TireGrowth, TireCirFt = tires(Vel[L], Ags0)
+      RPM0 = EngRPM[L]
+      Time0 = time[L]
+      if RPM0 == gc_LaunchRPM and Time0 == 0:
+        RPM0 = Stall
+        if gc_LaunchRPM < Stall:
+          Time0 = gc_EnginePMI * (Stall -
+                                             gc_LaunchRPM) / 250000
+      Dist0 = Dist[L]
+
+      #calc tire slip from traction index, track temp and downtrack location
+      Work = 0.005 * (gc_TractionIndex - 1) + 3 * (TrackTempEffect -
+                                                          1)
+      TireSlip = 1.02 + Work * (1 - (Dist0 / 1320)**2)
+
+      DSRPM0 = DSRPM
+      steps = steps + 1
+      rec(L, LAdd == 1)
+      if telemetry:
+        yield telemetry_record(steps - 1, LAdd == 1)
+      rows.reserve(L + 2)
+      L = L + LAdd
+      Gear[L] = iGear
+      LAdd = 0
+
+      #SELECT NEXT VELOCITY TO MEET VARIOUS OBJECTIVES (ShiftFlag < 2)
+      Vel[L] = Vel0 + Ags0 * gc * TimeStep + Jerk * gc * TimeStep**2 / 2
+
+      if ShiftFlag == 2:
+        loop = 270
+        continue
+
+      # don't let TimeStep exceed K7 steps per TimePrintInc
+      if TimeStep > (TimePrintInc / K7):
+        TimeStep = TimePrintInc / K7
+        if prof:
+          profile.clamps['print_interval'] += 1
+
+      # don't let TimeStep exceed TimePrint
+      if TimeStep > (TimePrint - Time0):
+        TimeStep = TimePrint - Time0
+        if prof:
+          profile.clamps['print_time'] += 1
+
+      # don't let TimeStep exceed 4.5 steps to distance print
+      if iDist > 1:
+        Work = ((DistToPrint[iDist] - DistToPrint[iDist - 1]) /
+                Vel0) / 4.5  #increased from 2.0 7/11/99
+        if TimeStep > Work:
+          TimeStep = Work
+          if prof:
+            profile.clamps['print_distance'] += 1
+
+      if TimeStep > 0.05:
+        TimeStep = 0.05  #reduced from .2 7/11/99
+        if prof:
+          profile.clamps['max_step'] += 1
+
+      # adaptive: let the step grow past those limits where the local error
+      # allows, but not past TimePrint
+      BaseStep = TimeStep
+      if adaptive and NextStep > TimeStep:
+        TimeStep = min(NextStep, TimePrint - Time0)
+
+      Vel[
+        L] = Vel0 + Ags0 * gc * TimeStep + Jerk * gc * TimeStep * TimeStep / 2
+
+      # don't let TimeStep exceed shift points
+      if Vel0 > 0 and RPM0 > Stall and iGear < NGR:
+        Work = Vel0 * (ShiftRPM[iGear] + 5) / RPM0
+        if Vel[L] > Work:
+          Vel[L] = Work
+          TimeStep = (Vel[L] - Vel0) / (Ags0 * gc)
+          if prof:
+            profile.clamps['shift_point'] += 1
+
+      # don't let TimeStep exceed distance print
+      DistStep = Dist0 + Vel0 * TimeStep + Ags0 * gc * TimeStep**2 / 2
+      if DistStep >= (DistToPrint[iDist] - DistTol) and not dense:
+        Vel[L] = math.sqrt(Vel0**2 + 2 * Ags0 * gc *
+                           (DistToPrint[iDist] - Dist0))
+        if prof:
+          profile.clamps['land_distance'] += 1
+
+    if loop <= 270:
+      #270
+      # ENTRY POINT FOR VELOCITY REVISION TO MATCH DISTANCE, TIME, OR SHIFT POINT PRINTS
+      if prof:
+        tick = profile.lap(Phase, tick)
+        Phase = 'clutch'
+      passes = passes + 1
+      if passes >= CheckPass:
+        CheckPass = passes + 64
+        if max_passes is not None and passes > max_passes:
+          raise DidNotConverge('step budget', steps, Time0, Dist0)
+        if cancel is not None and cancel.is_set():
+          raise DidNotConverge('cancelled', steps, Time0, Dist0)
+      VelSqrd = Vel[L]**2 - Vel0**2
+      DSRPM = TireSlip * Vel[L] * 60 / TireCirFt
+
+      #PERFORM CLUTCH AND CONVERTER CALCULATIONS
+      LockRPM = DSRPM * gc_GearRatio * TGR[iGear]
+      EngRPM[L] = gc_Slippage * LockRPM
+
+      if gc_TransType == 100:  #clutch
+        if EngRPM[L] < Stall:
+          if iGear == 1 or not gc_LockUp:
+            EngRPM[L] = Stall
+        ClutchSlip = LockRPM / EngRPM[L]
+      else:
+        if iGear == 1 or not gc_LockUp:  # non lock-up converter
+          zStall = Stall
+          SlipRatio = gc_Slippage * LockRPM / zStall
+
+          if L > 2:
+            if SlipRatio > 0.6:
+              zStall = zStall * (1 + (gc_Slippage - 1) *
+                                 (SlipRatio - 0.6) /
+                                 ((1 / gc_Slippage) - 0.6))
+            SlipRatio = gc_Slippage * LockRPM / zStall
+          ClutchSlip = 1 / gc_Slippage
+
+          if EngRPM[L] < zStall:
+            EngRPM[L] = zStall
+            Work = gc_TorqueMult - (gc_TorqueMult -
+                                               1) * SlipRatio
+            ClutchSlip = Work * LockRPM / zStall
+        else:  #lock-up converter
+          EngRPM[L] = 1.005 * LockRPM
+          ClutchSlip = LockRPM / EngRPM[L]
+
+      if ClutchSlip > 1:
+        ClutchSlip = 1
+
+      HP = EngineHP(EngRPM[L])  #Patrick - 2nd order in QProRx
+      HP = gc_HPTQMult * HP / hpc
+      HPSave = HP
+      HP = HP * ClutchSlip
+
+      if prof:
+        tick = profile.lap(Phase, tick)
+        Phase = 'forces'
+
+      #CALCULATE DRAG FORCES (FRICTION, VISCOUS AND AERODYNAMIC)    'Patrick - QProRx includes prevailing wind speed
+      WindFPS = math.sqrt(Vel[L]**2 + Vel[L] * WindCos + WindSq)
+      q = math.copysign(1, WindFPS) * rho * abs(WindFPS)**2 / (2 * gc)
+
+      #increase frontal area based on tire growth (crude method! - check QProRxCode Patrick)
+      RefArea2 = gc_RefArea + (TireGrowth - 1) * RefAreaK
+
+      DownForce = gc_Weight + gc_LiftCoef * RefArea2 * q
+      cmu1 = CMU - (Dist0 / 1320) * CMUK
+      DragForce = cmu1 * DownForce + ViscK * DownForce * Vel[L] + (
+        gc_DragCoef * RefArea2 * q)
+      DragHP = DragForce * Vel[L] / 550
+
+      #calculate dynamic weight on front tires
+      TireRadIn = 12 * TireCirFt / (2 * math.pi)
+      #FRCT should really be variable at this point, getting closer to 1 downtrack
+      deltaFWT = (Ags0 * gc_Weight *
+                  ((gc_YCG - TireRadIn) +
+                   (FRCT / gc_Efficiency) * TireRadIn) +
+                  DragForce * gc_YCG) / gc_Wheelbase
+      DynamicFWT = gc_StaticFWt - deltaFWT
+
+      #calculate wheelie bar weight
+      WheelBarWT = 0
+      if DynamicFWT < 0:
+        #assume 64" wheelie bar as required to keep dynamic front weight = 0
+        WheelBarWT = -DynamicFWT * gc_Wheelbase / 64
+        DynamicFWT = 0
+
+      #calculate dynamic force on rear tires
+      DynamicRWT = DownForce - DynamicFWT - WheelBarWT
+      if DynamicRWT < 0:
+        DynamicRWT = gc_Weight
+      #RWT(L) = dynamicRWT    'QProRxCode
+      CRTF = CRTFK * (0.92 + 0.08 * (DynamicRWT / 1900)**2.15)
+
+      AMAX = ((CRTF / TireGrowth) - DragForce) / gc_Weight
+
+      #CALCULATE RESIDUAL HORSEPOWER AVAILABLE (limit to AMax)
+      HP = HP * TGEff[iGear] * gc_Efficiency / TireSlip
+      HP = HP - DragHP
+      PQWT = PQK * HP
+      AGS[L] = PQWT / (Vel[L] * gc)
+
+      SLIP[L] = 0
+      if AGS[L] > AMAX:
+        SLIP[L] = 1
+        PQWT = PQWT * (AMAX - (AGS[L] - AMAX)) / AGS[L]
+        AGS[L] = AMAX - (AGS[L] - AMAX)
+
+      if AGS[L] < AMin:
+        PQWT = PQWT * AMin / AGS[L]
+        AGS[L] = AMin
+      time[L] = VelSqrd / (2 * PQWT) + Time0
+
+      EngAccHP = gc_EnginePMI * EngRPM[L] * (EngRPM[L] - RPM0)
+
+      if EngAccHP < 0:
+        if gc_TransType == 100:
+          EngAccHP = KP21 * EngAccHP
+        else:
+          EngAccHP = KP22 * EngAccHP
+
+      ChasAccHP = ChassisPMI * DSRPM * (DSRPM - DSRPM0)
+
+      if ChasAccHP < 0:
+        ChasAccHP = 0
+
+      if prof:
+        tick = profile.lap(Phase, tick)
+        Phase = 'inertia'
+      k = 0
+
+      #280 ITERATION TO CONVERGE INERTIA TRANSIENT check QProRxCode
+      while True:
+        k = k + 1
+        dtk1 = time[L] - Time0
+        Work = PMIK / dtk1
+        HPEngPMI = EngAccHP * Work
+        HPChasPMI = ChasAccHP * Work
+
+        HP = (HPSave - HPEngPMI) * ClutchSlip
+        HP = ((HP * TGEff[iGear] * gc_Efficiency - HPChasPMI) /
+              TireSlip) - DragHP
+        PQWT = PQK * HP
+        AGS[L] = PQWT / (Vel[L] * gc)
+
+        #steady iteration progress by using jerk limits
+        Jerk = 0
+        if dtk1 != 0:
+          Jerk = (AGS[L] - Ags0) / dtk1
+        if Jerk < JMin:
+          Jerk = JMin
+          AGS[L] = Ags0 + Jerk * dtk1
+          PQWT = AGS[L] * gc * Vel[L]
+        if Jerk > JMax:
+          Jerk = JMax
+          AGS[L] = Ags0 + Jerk * dtk1
+          PQWT = AGS[L] * gc * Vel[L]
+
+        #and observe min/max Ags limits
+        SLIP[L] = 0
+        if AGS[L] > AMAX:
+          SLIP[L] = 1
+          PQWT = PQWT * (AMAX - (AGS[L] - AMAX)) / AGS[L]
+          AGS[L] = AMAX - (AGS[L] - AMAX)
+        if AGS[L] < AMin:
+          PQWT = PQWT * AMin / AGS[L]
+          AGS[L] = AMin
+
+        time[L] = VelSqrd / (2 * PQWT) + Time0
+        dtk2 = time[L] - Time0
+        if k == 12 or abs(100 * (dtk2 - dtk1) / dtk2) <= 0.01:
+          break
+
+        z = HP / HPSave
+        if z < K6:
+          z = K6
+        if z > K61:
+          z = K61
+        time[L] = Time0 + dtk1 + z * (dtk2 - dtk1)
+
+      #300 CONVERGED VELOCITY STEP
+      if prof:
+        profile.inertia[k] += 1
+        tick = profile.lap(Phase, tick)
+        Phase = 'prints'
+      PrintFlag = 0
+      Dist[L] = ((2 * PQWT * (time[L] - Time0) + Vel0**2)**1.5 -
+                 Vel0**3) / (3 * PQWT) + Dist0
+
+      #CHECK FOR SHIFT 2 TIME PRINT OR VELOCITY REVISION
+      if ShiftFlag == 2:
+        if abs(Shift2PrintTime - time[L]) >= TimeTol:
+          Work = 2 * PQWT * (Shift2PrintTime - time[L]) + Vel[L]**2  #QProRx
+          if Work > 0:
+            Vel[L] = math.sqrt(Work)
+            loop = 270
+            continue
+
+        ASV[1] = time[L]
+        ASV[2] = Dist[L]
+        ASV[3] = Vel[L]
+        ASV[4] = AGS[L]
+        ASV[5] = SLIP[L]
+        ASV[6] = EngRPM[L]
+        ASV[7] = Gear[L]
+        doOpt()
+
+        #305
+        PrintFlag = 1
+        loop = 340
+
+    if loop <= 330:
+      #330 CHECK FOR revised DISTANCE PRINT
+      VelDistMatch = 0
+      DistStep = abs(DistToPrint[iDist] - Dist[L])
+      if dense:
+        pass  #found after the step, below
+      elif DistStep < DistTol and (DistStep / Vel[L]) < TimeTol:
+        PrintFlag = 1
+        if iDist == 1 and gc_Rollout == 0:
+          PrintFlag = -1
+        if iDist == 5 or iDist == 8 and ShiftFlag < 2:
+          PrintFlag = -1
+      else:
+        if Dist[L] > DistToPrint[iDist]:
+          Work = 3 * PQWT * (DistToPrint[iDist] - Dist[L]) + Vel[L]**3
+          if Work > 0:
+            VelDistMatch = Work**(1 / 3)
+          if Dist[L] > 1.05 * DistToPrint[9]:
+            break  #special check to stop endless program execution
+
+      #CHECK FOR revised TIME PRINT
+      VelTimeMatch = 0
+      if abs(TimePrint - time[L]) < TimeTol:
+        PrintFlag = 1
+      else:
+        if time[L] > TimePrint:
+          Work = 2 * PQWT * (TimePrint - time[L]) + Vel[L]**2
+          if Work > 0:
+            VelTimeMatch = math.sqrt(Work)
+
+      #CHECK FOR revised SPEED MATCH PRINT
+      VelMPHMatch = 0
+      if iMPH <= 2:
+        if abs(MPHtoPrint[iMPH] - Vel[L]) < KV:
+          PrintFlag = 1
+        else:
+          if Vel[L] > MPHtoPrint[iMPH]:
+            VelMPHMatch = MPHtoPrint[iMPH]
+
+      #CHECK FOR revised SHIFT 1 PRINT (top of gear change)
+      VelShiftMatch = 0
+      if iGear < NGR:
+        if abs(ShiftRPM[iGear] - EngRPM[L]) < ShiftRPMTol:
+          PrintFlag = 1
+        else:
+          if EngRPM[L] > ShiftRPM[iGear]:
+            VelShiftMatch = Vel[L] * ShiftRPM[iGear] / EngRPM[L]
+
+      #CHECK FOR LOCAL ERROR (adaptive): the end point power step against
+      #the power trapezoid rule
+      VelErrMatch = 0
+      if adaptive:
+        dt = time[L] - Time0
+        ErrTime = abs(dt - VelSqrd / (PQWT0 + PQWT))
+        ErrRatio = max(ErrTime / time_tol, ErrTime * Vel[L] / dist_tol)
+        StepGrow = 0.9 / math.sqrt(max(ErrRatio, 0.0324))  #up to 5 times
+        if ErrRatio > 1 and dt > 1.01 * BaseStep:
+          VelErrMatch = Vel0 + max(StepGrow, 0.2, BaseStep / dt) * (Vel[L] -
+                                                                   Vel0)
+
+      #CHECK FOR REQUIRED VELOCITY REVISIONS
+      NextVel = Vel[L]
+      if VelErrMatch > 0 and VelErrMatch < NextVel:
+        NextVel = VelErrMatch
+      if VelDistMatch > 0 and VelDistMatch < NextVel:
+        NextVel = VelDistMatch
+      if VelTimeMatch > 0 and VelTimeMatch < NextVel:
+        NextVel = VelTimeMatch
+      if VelMPHMatch > 0 and VelMPHMatch < NextVel:
+        NextVel = VelMPHMatch
+      if VelShiftMatch > 0 and VelShiftMatch < NextVel:
+        NextVel = VelShiftMatch
+
+      #dense: a shift point passed during the step ends the step there
+      if dense and NextVel == VelShiftMatch and Vel0 < NextVel < Vel[L]:
+        factor = (NextVel - Vel0) / (Vel[L] - Vel0)
+        time[L] = Time0 + (NextVel**2 - Vel0**2) / (2 * PQWT)
+        Dist[L] = (NextVel**3 - Vel0**3) / (3 * PQWT) + Dist0
+        AGS[L] = Ags0 + factor * (AGS[L] - Ags0)
+        DSRPM = DSRPM * NextVel / Vel[L]
+        Vel[L] = NextVel
+        EngRPM[L] = ShiftRPM[iGear]
+        PrintFlag = 1
+
+      #Patrick - when NextVel = Vel0 or NextVel = Vel(l) program just accepts the
+      #non-matched answer and presses on without printline - 10/04/03
+      if NextVel > Vel0 and NextVel < Vel[L]:
+        Vel[L] = NextVel
+        loop = 270
+        continue
+
+      #size the next step from this one; steps cut short to land on a
+      #print or shift point don't shrink it
+      if adaptive:
+        if dt >= 0.99 * TimeStep or StepGrow * dt > NextStep:
+          NextStep = StepGrow * dt
+
+      #dense: distance prints passed during the step
+      if dense:
+        while iDist < 9 and Dist[L] >= DistToPrint[iDist] - DistTol:
+          subDense()
+          iDist = iDist + 1
+        if Dist[L] >= DistToPrint[9] - DistTol:
+          subMarks(DistToPrint[9])
+          subDense()
+          break  #350 RUN COMPLETED
+
+      #set value of ShiftFlag
+      if iGear < NGR and abs(ShiftRPM[iGear] - EngRPM[L]) < ShiftRPMTol:
+        ShiftFlag = 1
+
+    #340 BOTTOM OF PRE-PRINT CHECKS, NOW CHECK FOR PRINTING
+    subMarks()
+    if PrintFlag == 0:
+      loop = 240
+      continue
+
+    #CHECK FOR Distance PRINT
+    DistStep = abs(DistToPrint[iDist] - Dist[L])
+    if (DistStep < DistTol and (DistStep / Vel[L]) < TimeTol and not dense
+        ) or (ShiftFlag == 2 and Dist[L] >= DistToPrint[iDist]):
+      if iDist == 1:
+        DistTol = 0.1  #reduced from .25 - 07/11/99
+        if gc_Rollout > 0:
+          time[L] = 0
+        Dist[L] = Dist[L] + ovradj  #adjust for front overhang
+      elif iDist == 3:
+        if ShiftFlag < 2:
+          TIMESLIP[1] = time[L]
+        #special test for completing shift precisely at 60 ft - Patrick 12/12/05
+        if ShiftFlag == 2 and TIMESLIP[1] == 0:
+          TIMESLIP[1] = time[L]
+      elif iDist == 4:
+        if ShiftFlag < 2:
+          TIMESLIP[2] = time[L]
+        DistTol = 0.008
+      elif iDist == 5:
+        if ShiftFlag < 2 or SaveTime == 0:
+          SaveTime = time[L]
+      elif iDist == 6:
+        if ShiftFlag < 2:
+          TIMESLIP[3] = time[L]
+          TIMESLIP[4] = Z5 * 66 / (TIMESLIP[3] - SaveTime)
+          SaveTime = 0
+      elif iDist == 7:
+        if ShiftFlag < 2:
+          TIMESLIP[5] = time[L]
+      elif iDist == 8:
+        if ShiftFlag < 2 or SaveTime == 0:
+          SaveTime = time[L]
+      elif iDist == 9:
+        if ShiftFlag < 2:
+          TIMESLIP[6] = time[L]
+          TIMESLIP[7] = Z5 * 66 / (TIMESLIP[6] - SaveTime)
+          SaveTime = 0
+
+      if ShiftFlag < 2 or iDist not in points:
+        mark(iDist)
+      if iDist == 9:
+        subMarks(DistToPrint[9])
+        break  #350 RUN COMPLETED
+
+      if PrintFlag != -1:
+        LAdd = 1
+      iDist = iDist + 1
+
+    #CHECK FOR PRINT TIME INCREMENT UPDATE
+    if (abs(TimePrint - time[L]) < TimeTol) or (ShiftFlag == 2
+                                                and time[L] >= TimePrint):
+      TimePrint = TimePrint + TimePrintInc
+      LAdd = 1
+
+    #CHECK FOR SPEED MATCH
+    if iMPH <= 2:
+      if (abs(MPHtoPrint[iMPH] - Vel[L]) < KV) or (ShiftFlag == 2 and
+                                                   Vel[L] >= MPHtoPrint[iMPH]):
+        iMPH = iMPH + 1
+        LAdd = 1
+
+    #CHECK FOR GEAR CHANGE
+    if ShiftFlag == 1:
+      ShiftFlag = 2
+      iGear = iGear + 1
+      LAdd = 1
+      if checkpoints is not None:
+        checkpoints.append(snapshot(230))
+      loop = 230
+      continue
+    if ShiftFlag == 2:
+      ShiftFlag = 0
+      LAdd = 1
+
+    #BOTTOM OF POST PRINT CHECKS, CONTINUE DOWN TRACK
+    if checkpoints is not None and LAdd == 1:
+      checkpoints.append(snapshot(240))
+    loop = 240
+
+  #350 RUN COMPLETED, LOAD TIMESLIP DATA
+  if prof:
+    profile.lap(Phase, tick)
+    profile.runs += 1
+    profile.steps += steps
+    profile.passes += passes
+  rec(L, True)
+  if telemetry:
+    yield telemetry_record(steps, True)
+  trace = Trace(time[1:L + 1], Dist[1:L + 1], Vel[1:L + 1], AGS[1:L + 1],
+                SLIP[1:L + 1], EngRPM[1:L + 1], Gear[1:L + 1])
+  # a mark at a print distance is that print row: a classic print is the
+  # step end within DistTol of it, not a point interpolated on the step
+  rows = {p.dist: p for i, p in points.items() if i > 1}
+  marks = sorted((rows.get(p.dist, p) for p in MarkPoints),
+                 key=lambda p: p.time)
+  return RunResult(rho, hpc, tuple(TIMESLIP[1:]),
+                   [points[i] for i in sorted(points)], trace, steps,
+                   tuple(marks), passes)
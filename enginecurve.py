@@ -0,0 +1,109 @@
+from bisect import bisect_right
+
+
+class EngineCurve:
+  # engine HP (or torque) vs RPM as the RSALIB TABY interpolation, built once
+  # per run; order 1 is linear, order 2 the quadratic used by QProRx
+  # segment k is y[k] + (x - x[k]) * (slopes[k] + (x - x[k+1]) * d2[k])
+
+  def __init__(self, rpm, values, order=1):
+    if order not in (1, 2):
+      raise ValueError(f'order must be 1 or 2, not {order!r}')
+    rpm = tuple(float(x) for x in rpm)
+    values = tuple(float(y) for y in values)
+    n = len(rpm)
+    if n < 2 or len(values) != n:
+      raise ValueError('need two or more RPM points with one value each')
+    if any(b <= a for a, b in zip(rpm, rpm[1:])):
+      raise ValueError('RPM points must be increasing')
+    self.rpm = rpm
+    self.values = values
+    self.order = order
+    self.n = n
+    self.slopes = tuple((values[k + 1] - values[k]) / (rpm[k + 1] - rpm[k])
+                        for k in range(n - 1))
+
+    # TABY: the bracket k, k+1 grows to k, k+1, k+2 for order 2, or back
+    # to k-1, k, k+1 on the last segment
+    d2 = []
+    for k in range(n - 1):
+      if order == 1 or n == 2:
+        d2.append(0.0)
+      elif k + 2 < n:
+        d2.append((self.slopes[k + 1] - self.slopes[k]) /
+                  (rpm[k + 2] - rpm[k]))
+      else:
+        d2.append((self.slopes[k] - self.slopes[k - 1]) /
+                  (rpm[k + 1] - rpm[k - 1]))
+    self.d2 = tuple(d2)
+
+  def __call__(self, rpm):
+    # O(log n) lookup; outside the table extrapolate the end segment
+    # linearly, as TABY does
+    k = bisect_right(self.rpm, rpm) - 1
+    if k < 0:
+      return self.values[0] + (rpm - self.rpm[0]) * self.slopes[0]
+    if k >= self.n - 1:
+      if rpm == self.rpm[-1]:
+        return self.values[-1]
+      return self.values[-2] + (rpm - self.rpm[-2]) * self.slopes[-1]
+    return self.values[k] + (rpm - self.rpm[k]) * (
+      self.slopes[k] + (rpm - self.rpm[k + 1]) * self.d2[k])
+
+  def batch(self, rpm):
+    # the same lookup over an array of RPMs
+    import numpy as np
+    rpm = np.asarray(rpm, float)
+    x = np.array(self.rpm)
+    y = np.array(self.values)
+    slopes = np.array(self.slopes)
+    d2 = np.array(self.d2)
+
+    k = np.clip(np.searchsorted(x, rpm, side='right') - 1, 0, self.n - 2)
+    inside = (rpm >= x[0]) & (rpm < x[-1])
+    dx = rpm - x[k]
+    result = y[k] + dx * (slopes[k] + np.where(inside,
+                                               (rpm - x[k + 1]) * d2[k], 0))
+    return np.where(rpm == x[-1], y[-1], result)
+
+  @classmethod
+  def hp(cls, vehicle, order=1):
+    return cls(vehicle.gc_EngineRPM, vehicle.gc_EngineHP, order)
+
+  @classmethod
+  def torque(cls, vehicle, order=1):
+    return cls(vehicle.gc_EngineRPM, vehicle.gc_EngineTQ, order)
+
+
+class CurveStack:
+  # one EngineCurve per ensemble lane, evaluated lane by lane in one call;
+  # the curves must have the same number of points
+
+  def __init__(self, curves):
+    import numpy as np
+    curves = list(curves)
+    if len({curve.n for curve in curves}) > 1:
+      raise ValueError('stacked engine curves need the same number of points')
+    self.n = curves[0].n
+    self.rpm = np.array([curve.rpm for curve in curves])
+    self.values = np.array([curve.values for curve in curves])
+    self.slopes = np.array([curve.slopes for curve in curves])
+    self.d2 = np.array([curve.d2 for curve in curves])
+
+  def __call__(self, rpm, lanes=None):
+    # value of curve lanes[i] at rpm[i] (all lanes when lanes is None)
+    import numpy as np
+    if lanes is None:
+      lanes = np.arange(len(self.rpm))
+    x = self.rpm[lanes]
+    k = (x <= rpm[:, None]).sum(axis=1) - 1
+    top = k >= self.n - 1
+    k = np.clip(k, 0, self.n - 2)
+    x0 = x[np.arange(len(k)), k]
+    x1 = x[np.arange(len(k)), k + 1]
+    y0 = self.values[lanes, k]
+    inside = (k > 0) | (rpm >= x0)
+    inside &= ~top
+    result = y0 + (rpm - x0) * (self.slopes[lanes, k] + np.where(
+      inside, (rpm - x1) * self.d2[lanes, k], 0))
+    return np.where(rpm == x[:, -1], self.values[lanes, -1], result)
@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, SubmitField, RadioField, FloatField, SelectField, BooleanField, validators, PasswordField, TextAreaField
+from wtforms import StringField, SubmitField, FloatField, SelectField, BooleanField, validators, PasswordField, TextAreaField
 from wtforms.validators import DataRequired, Email
 
 
@@ -53,10 +53,11 @@ class ConverterSlipForm(FlaskForm):
 
 
 class QuarterProForm(FlaskForm):
-  gc_PressType = RadioField("Pressure Type",
-                            choices=[('1', 'Std Altimeter (ft)'),
-                                     ('2', 'Abs Barometer (inHg)')],
-                            default='2')
+  gc_PressType = SelectField("Pressure Type",
+                             choices=[('0', 'Barometer at Elevation'),
+                                      ('1', 'Std Altimeter (ft)'),
+                                      ('2', 'Abs Barometer (inHg)')],
+                             default='0')
   gc_Altimeter = FloatField("Elevation (ft)", default=32)
   gc_Pressure = FloatField("Pressure", default=29.92)
   gc_Barometer = FloatField("Barometer (inHg)", default=29.92)
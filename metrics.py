@@ -0,0 +1,366 @@
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# request latency buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1, 2.5, 5)
+# initial size of a process's sample file; it doubles as needed
+_FILE_SIZE = 1 << 16
+
+
+def _labels(names, values):
+  if not names:
+    return ''
+  pairs = ','.join(f'{name}="{_escape(value)}"'
+                   for name, value in zip(names, values))
+  return '{' + pairs + '}'
+
+
+def _escape(value):
+  return str(value).replace('\\', r'\\').replace('\n', r'\n').replace(
+    '"', r'\"')
+
+
+def _number(x):
+  if x == math.inf:
+    return '+Inf'
+  if isinstance(x, float) and x.is_integer() and abs(x) < 1e15:
+    return str(int(x))
+  return repr(x) if isinstance(x, float) else str(x)
+
+
+class Counter:
+
+  def __init__(self, name, doc, labels=()):
+    self.name = name
+    self.doc = doc
+    self.labels = tuple(labels)
+    self._values = {}
+    self._lock = threading.Lock()
+    # a _SampleFile when the registry is shared between processes
+    self._file = None
+
+  def inc(self, *labels, amount=1):
+    if self._file is not None:
+      self._file.add((self.name, '', labels), amount)
+      return
+    with self._lock:
+      self._values[labels] = self._values.get(labels, 0) + amount
+
+  def expose(self, samples=None):
+    lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} counter']
+    if samples is None:
+      with self._lock:
+        values = sorted(self._values.items())
+    else:
+      values = sorted((labels, value) for (_, labels), value in samples.get(
+        self.name, {}).items())
+    for labels, value in values:
+      lines.append(f'{self.name}{_labels(self.labels, labels)} '
+                   f'{_number(value)}')
+    return lines
+
+
+class Histogram:
+  # fixed buckets, one set of bucket counts per label values; observe() is
+  # a bisect and three adds under a lock
+
+  def __init__(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+    self.name = name
+    self.doc = doc
+    self.labels = tuple(labels)
+    self.buckets = tuple(sorted(buckets))
+    self._series = {}
+    self._lock = threading.Lock()
+    self._file = None
+
+  def observe(self, value, *labels):
+    i = bisect_left(self.buckets, value)
+    if self._file is not None:
+      # the bucket's own count (not cumulative), the sum and the count
+      self._file.add((self.name, i, labels), 1)
+      self._file.add((self.name, 'sum', labels), value)
+      self._file.add((self.name, 'count', labels), 1)
+      return
+    with self._lock:
+      series = self._series.get(labels)
+      if series is None:
+        series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+      series[0][i] += 1
+      series[1] += value
+      series[2] += 1
+
+  def expose(self, samples=None):
+    lines = [f'# HELP {self.name} {self.doc}',
+             f'# TYPE {self.name} histogram']
+    if samples is None:
+      with self._lock:
+        series = sorted((labels, (list(counts), total, n))
+                        for labels, (counts, total, n) in self._series.items())
+    else:
+      merged = {}
+      for (part, labels), value in samples.get(self.name, {}).items():
+        entry = merged.setdefault(labels, [[0] * (len(self.buckets) + 1), 0.0,
+                                           0])
+        if part == 'sum':
+          entry[1] = value
+        elif part == 'count':
+          entry[2] = int(value)
+        else:
+          entry[0][part] = int(value)
+      series = sorted((labels, tuple(entry)) for labels, entry in merged.items())
+    names = self.labels + ('le', )
+    for labels, (counts, total, n) in series:
+      cumulative = 0
+      for bound, count in zip(self.buckets + (math.inf, ), counts):
+        cumulative += count
+        lines.append(f'{self.name}_bucket'
+                     f'{_labels(names, labels + (_number(bound), ))} '
+                     f'{cumulative}')
+      lines.append(f'{self.name}_sum{_labels(self.labels, labels)} '
+                   f'{_number(total)}')
+      lines.append(f'{self.name}_count{_labels(self.labels, labels)} {n}')
+    return lines
+
+
+class Gauge:
+  # read when scraped: fn() returns a number or (label values, number)
+  # pairs; kind='counter' for totals kept elsewhere, like cache hits
+
+  def __init__(self, name, doc, fn, labels=(), kind='gauge'):
+    self.name = name
+    self.doc = doc
+    self.fn = fn
+    self.labels = tuple(labels)
+    self.kind = kind
+
+  def values(self):
+    values = self.fn()
+    if not isinstance(values, (list, tuple)):
+      values = [((), values)]
+    return [(tuple(labels), value) for labels, value in values]
+
+  def expose(self, samples=None):
+    lines = [f'# HELP {self.name} {self.doc}',
+             f'# TYPE {self.name} {self.kind}']
+    names = self.labels
+    if samples is None:
+      values = self.values()
+    else:
+      # counters summed over processes; gauges one per live process
+      values = sorted((labels, value) for (_, labels), value in samples.get(
+        self.name, {}).items())
+      if self.kind != 'counter':
+        names += ('pid', )
+    for labels, value in values:
+      lines.append(f'{self.name}{_labels(names, labels)} '
+                   f'{_number(value)}')
+    return lines
+
+
+class _SampleFile:
+  # one process's samples, memory mapped at directory/<kind>_<pid>.db so
+  # whichever process answers a scrape reads the current values of all of
+  # them: an 8-byte used length, then per sample a 4-byte key length, the
+  # JSON key padded to 8 bytes and a float64.  A forked child starts a file
+  # of its own.
+
+  def __init__(self, directory, kind):
+    self.directory = directory
+    self.kind = kind
+    self._pid = None
+    self._lock = threading.Lock()
+
+  def _open(self):
+    if self._pid is not None:
+      # this process's copies of the parent's file
+      self._map.close()
+      os.close(self._fd)
+    self._pid = os.getpid()
+    path = os.path.join(self.directory, f'{self.kind}_{self._pid}.db')
+    # a server re-exec'd by a graceful reload keeps its pid, and carries on
+    # from its file
+    self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    size = os.fstat(self._fd).st_size
+    if size < _FILE_SIZE:
+      os.ftruncate(self._fd, _FILE_SIZE)
+    self._map = mmap.mmap(self._fd, max(size, _FILE_SIZE))
+    self._used = struct.unpack_from('<Q', self._map)[0] or 8
+    self._offsets = {key: offset
+                     for key, offset in _entries(self._map, self._used)}
+    struct.pack_into('<Q', self._map, 0, self._used)
+
+  def _offset(self, key):
+    if self._pid != os.getpid():
+      self._open()
+    offset = self._offsets.get(key)
+    if offset is not None:
+      return offset
+    data = json.dumps([key[0], key[1], list(key[2])]).encode()
+    size = 4 + len(data) + (-(4 + len(data)) % 8) + 8
+    if self._used + size > len(self._map):
+      grown = len(self._map)
+      while self._used + size > grown:
+        grown *= 2
+      self._map.close()
+      os.ftruncate(self._fd, grown)
+      self._map = mmap.mmap(self._fd, grown)
+    # the entry is written before the used length that makes it visible
+    struct.pack_into(f'<I{len(data)}s', self._map, self._used, len(data), data)
+    offset = self._used + size - 8
+    struct.pack_into('<d', self._map, offset, 0.0)
+    self._used += size
+    struct.pack_into('<Q', self._map, 0, self._used)
+    self._offsets[key] = offset
+    return offset
+
+  def add(self, key, amount):
+    with self._lock:
+      offset = self._offset(key)
+      value, = struct.unpack_from('<d', self._map, offset)
+      struct.pack_into('<d', self._map, offset, value + amount)
+
+  def set(self, key, value):
+    with self._lock:
+      offset = self._offset(key)
+      struct.pack_into('<d', self._map, offset, value)
+
+
+def _entries(data, used):
+  # (name, part, labels), value offset for each sample in a file's data
+  pos = 8
+  while pos < min(used, len(data)):
+    size, = struct.unpack_from('<I', data, pos)
+    name, part, labels = json.loads(bytes(data[pos + 4:pos + 4 + size]))
+    pos += 4 + size + (-(4 + size) % 8)
+    yield (name, part, tuple(labels)), pos
+    pos += 8
+
+
+def _read(path):
+  # (name, part, labels), value for each sample in a sample file
+  with open(path, 'rb') as f:
+    data = f.read()
+  used, = struct.unpack_from('<Q', data) if len(data) >= 8 else (0, )
+  for key, offset in _entries(data, used):
+    yield key, struct.unpack_from('<d', data, offset)[0]
+
+
+def _alive(pid):
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  except PermissionError:
+    pass
+  return True
+
+
+def mark_process_dead(directory, pid):
+  # drop a finished process's gauges; its counters stay in the totals
+  try:
+    os.remove(os.path.join(directory, f'gauge_{pid}.db'))
+  except FileNotFoundError:
+    pass
+
+
+class Registry:
+  # metrics in the Prometheus text exposition format.  Without a directory
+  # they are this process's.  With one, every process sharing it (the
+  # workers of serve.py) keeps its samples in a file there, and expose()
+  # reports all of them: counters, histograms and counter-kind gauges are
+  # summed over the processes, finished ones included, so they never drop
+  # between scrapes; other gauges are one series per live process, labelled
+  # pid.  Gauge callbacks are read into the files by sync(); a forked child
+  # publishes its counter-kind gauges less what it inherited.
+
+  def __init__(self, directory=None):
+    self._metrics = []
+    self.directory = directory
+    self._files = None
+    self._baseline = self._forking = {}
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+      self._files = {kind: _SampleFile(directory, kind)
+                     for kind in ('counter', 'gauge')}
+      os.register_at_fork(before=self._before_fork,
+                          after_in_child=self._after_fork)
+
+  def _counter_gauges(self):
+    return [metric for metric in self._metrics
+            if isinstance(metric, Gauge) and metric.kind == 'counter']
+
+  def _before_fork(self):
+    self._forking = {metric.name: dict(metric.values())
+                     for metric in self._counter_gauges()}
+
+  def _after_fork(self):
+    self._baseline = self._forking
+
+  def add(self, metric):
+    self._metrics.append(metric)
+    if self._files and not isinstance(metric, Gauge):
+      metric._file = self._files['counter']
+    return metric
+
+  def counter(self, name, doc, labels=()):
+    return self.add(Counter(name, doc, labels))
+
+  def histogram(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+    return self.add(Histogram(name, doc, labels, buckets))
+
+  def gauge(self, name, doc, fn, labels=(), kind='gauge'):
+    return self.add(Gauge(name, doc, fn, labels, kind))
+
+  def sync(self):
+    # publish this process's gauge callbacks; a no-op without a directory
+    if not self._files:
+      return
+    for metric in self._metrics:
+      if not isinstance(metric, Gauge):
+        continue
+      baseline = self._baseline.get(metric.name, {})
+      counter = metric.kind == 'counter'
+      file = self._files['counter' if counter else 'gauge']
+      for labels, value in metric.values():
+        if counter:
+          value -= baseline.get(labels, 0)
+        file.set((metric.name, '', labels), value)
+
+  def _collect(self):
+    # name -> {(part, labels): value} over every process's file
+    samples = {}
+    for entry in os.scandir(self.directory):
+      kind, _, pid = entry.name[:-len('.db')].partition('_')
+      if not entry.name.endswith('.db') or not pid.isdigit():
+        continue
+      if kind == 'gauge' and not _alive(int(pid)):
+        continue
+      try:
+        items = list(_read(entry.path))
+      except FileNotFoundError:
+        continue
+      for (name, part, labels), value in items:
+        series = samples.setdefault(name, {})
+        if kind == 'gauge':
+          series[(part, labels + (pid, ))] = value
+        else:
+          series[(part, labels)] = series.get((part, labels), 0) + value
+    return samples
+
+  def expose(self):
+    samples = None
+    if self._files:
+      self.sync()
+      samples = self._collect()
+    lines = []
+    for metric in self._metrics:
+      lines.extend(metric.expose(samples))
+    return '\n'.join(lines) + '\n'
+
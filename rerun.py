@@ -0,0 +1,87 @@
+from typing import NamedTuple
+
+from engine import simulate_run
+
+# vehicle fields first read at a given gear: changing entry k (1-based) of
+# these tables leaves the run before gear k untouched.  gc_LockUp only
+# matters from gear 2 on; ShiftRPM 1 also sets the stall speed and the
+# shift tolerance, so it is not listed
+_PER_GEAR = ('gc_ShiftRPM', 'gc_TransGR', 'gc_TransEff')
+
+
+def first_gear_affected(old_vehicle, old_env, new_vehicle, new_env):
+  # the earliest gear whose steps an edit can change: 1 means the whole
+  # run, None no change at all
+  if old_env != new_env:
+    return 1
+  ngr = len(old_vehicle.gc_TransGR)
+  if len(new_vehicle.gc_TransGR) != ngr:
+    return 1
+  gear = None
+  for name, _, _ in type(old_vehicle)._FIELDS:
+    old, new = getattr(old_vehicle, name), getattr(new_vehicle, name)
+    if name == 'gc_ShiftRPM':
+      # shift points past the next to last gear are never used
+      old, new = old[:ngr - 1], new[:ngr - 1]
+    if old == new:
+      continue
+    if name == 'gc_LockUp':
+      first = 2
+    elif name in _PER_GEAR and len(old) == len(new):
+      first = min(k for k, (a, b) in enumerate(zip(old, new), 1) if a != b)
+    else:
+      first = 1
+    gear = first if gear is None else min(gear, first)
+  return gear
+
+
+def resume_point(checkpoints, old_vehicle, old_env, new_vehicle, new_env):
+  """Latest of an earlier run's checkpoints that a new run can resume from.
+
+  checkpoints come from simulate_run(old_vehicle, old_env,
+  checkpoints=...); the new run must use the same options.  Returns None
+  when the edit reaches back to the launch.  A checkpoint is kept if it
+  lies in an earlier gear than any the edit affects, or is the gear change
+  into that gear.
+  """
+  gear = first_gear_affected(old_vehicle, old_env, new_vehicle, new_env)
+  if gear is None:
+    return checkpoints[-1] if checkpoints else None
+  best = None
+  for c in checkpoints:
+    if c.gear < gear or c.gear == gear and c.label == 230:
+      best = c
+  return best
+
+
+class Rerun(NamedTuple):
+  result: object
+  # where the run was resumed from (None: from the line) and the steps
+  # that did not have to be run again
+  resumed: object
+  reused_steps: int
+
+
+class IncrementalRun:
+  # simulate_run for a stream of edits to one setup: each run keeps its
+  # checkpoints, and the next resumes from the latest one the edit leaves
+  # valid, so only the changed tail is integrated again
+
+  def __init__(self, **options):
+    self.options = options
+    self.vehicle = self.env = None
+    self.checkpoints = []
+
+  def run(self, vehicle, env):
+    resume = None
+    if self.vehicle is not None:
+      resume = resume_point(self.checkpoints, self.vehicle, self.env, vehicle,
+                            env)
+    checkpoints = []
+    result = simulate_run(vehicle, env, checkpoints=checkpoints,
+                          resume=resume, **self.options)
+    if resume is not None:
+      kept = self.checkpoints.index(resume) + 1
+      checkpoints = self.checkpoints[:kept] + checkpoints
+    self.vehicle, self.env, self.checkpoints = vehicle, env, checkpoints
+    return Rerun(result, resume, resume.steps if resume is not None else 0)
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import NamedTuple
+
+from engine import simulate_run
+
+# modules whose source decides a run's result; editing any of them changes
+# engine_version() and so invalidates every cached result
+ENGINE_MODULES = ('engine.py', 'tire.py', 'enginecurve.py', 'converter.py',
+                  'atmosphere.py', 'specs.py', 'tracebuf.py')
+
+_version = None
+
+
+def engine_version():
+  global _version
+  if _version is None:
+    digest = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in ENGINE_MODULES:
+      with open(os.path.join(here, name), 'rb') as f:
+        digest.update(f.read())
+    _version = digest.hexdigest()[:16]
+  return _version
+
+
+@lru_cache(maxsize=256)
+def _canonical(spec):
+  # specs are frozen and hashable, so each one is serialized once
+  return json.dumps([type(spec).__name__, spec.to_dict()], sort_keys=True,
+                    separators=(',', ':'))
+
+
+def run_key(vehicle, env, **options):
+  # canonical hash of everything that goes into simulate_run; the specs
+  # are already coerced, so 4 and 4.0 give the same key
+  options = {k: list(v) if isinstance(v, (list, tuple)) else v
+             for k, v in options.items()}
+  digest = hashlib.sha256(engine_version().encode())
+  for text in (_canonical(vehicle), _canonical(env),
+               json.dumps(options, sort_keys=True, separators=(',', ':'))):
+    digest.update(b'\0' + text.encode())
+  return digest.hexdigest()
+
+
+class ResultCacheInfo(NamedTuple):
+  hits: int
+  misses: int
+  evictions: int
+  entries: int
+  bytes: int
+  maxbytes: int
+
+
+class ResultCache:
+  # RunResults pickled into a SQLite file, evicted least recently used
+  # past maxbytes; WAL mode lets every worker process share one file
+  # hits/misses/evictions count this process only.  A hit only writes its
+  # used time back once it is touch seconds stale, so repeated hits on a
+  # hot key stay read-only; eviction order is exact to within touch
+
+  def __init__(self, path, maxbytes=64 << 20, simulate=simulate_run,
+               touch=60.0):
+    self.path = path
+    self.maxbytes = maxbytes
+    self.simulate = simulate
+    self.touch = touch
+    self._local = threading.local()
+    self._lock = threading.Lock()
+    self._purged = False
+    self.hits = self.misses = self.evictions = 0
+
+  def _db(self):
+    # one connection per thread, and a new one after fork
+    db = getattr(self._local, 'db', None)
+    if db is not None and self._local.pid == os.getpid():
+      return db
+    directory = os.path.dirname(self.path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    db.execute('BEGIN IMMEDIATE')
+    try:
+      db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, '
+                 'version TEXT, used REAL, size INTEGER, value BLOB)')
+      db.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+      # entry count and bytes, kept by triggers so no put has to scan
+      db.execute('CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY '
+                 'CHECK (id = 0), entries INTEGER, bytes INTEGER)')
+      db.execute('CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT '
+                 'ON results BEGIN UPDATE totals SET entries = entries + 1, '
+                 'bytes = bytes + new.size; END')
+      db.execute('CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE '
+                 'ON results BEGIN UPDATE totals SET entries = entries - 1, '
+                 'bytes = bytes - old.size; END')
+      db.execute('CREATE TRIGGER IF NOT EXISTS results_resize AFTER UPDATE OF '
+                 'size ON results BEGIN UPDATE totals SET '
+                 'bytes = bytes + new.size - old.size; END')
+      if db.execute('SELECT 1 FROM totals').fetchone() is None:
+        db.execute('INSERT INTO totals SELECT 0, COUNT(*), '
+                   'COALESCE(SUM(size), 0) FROM results')
+      if not self._purged:
+        # results of other engine versions can never hit again.  Once per
+        # cache, not per connection: during a graceful reload old and new
+        # workers share the file, and forked workers inherit the flag
+        db.execute('DELETE FROM results WHERE version != ?',
+                   (engine_version(), ))
+        self._purged = True
+      db.execute('COMMIT')
+    except BaseException:
+      db.execute('ROLLBACK')
+      raise
+    self._local.db = db
+    self._local.pid = os.getpid()
+    return db
+
+  def get(self, key):
+    db = self._db()
+    row = db.execute('SELECT value, used FROM results WHERE key = ?',
+                     (key, )).fetchone()
+    if row is None:
+      with self._lock:
+        self.misses += 1
+      return None
+    now = time.time()
+    if now - row[1] >= self.touch:
+      db.execute('UPDATE results SET used = ? WHERE key = ?', (now, key))
+    with self._lock:
+      self.hits += 1
+    return pickle.loads(row[0])
+
+  def put(self, key, result):
+    value = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+    db = self._db()
+    db.execute('INSERT INTO results VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) '
+               'DO UPDATE SET version = excluded.version, '
+               'used = excluded.used, size = excluded.size, '
+               'value = excluded.value',
+               (key, engine_version(), time.time(), len(value), value))
+    self._evict(db)
+
+  def _evict(self, db):
+    total, = db.execute('SELECT bytes FROM totals').fetchone()
+    while total > max(self.maxbytes, 0):
+      rows = db.execute('SELECT key, size FROM results ORDER BY used LIMIT 64'
+                        ).fetchall()
+      if not rows:
+        break
+      for key, size in rows:
+        if total <= self.maxbytes:
+          break
+        db.execute('DELETE FROM results WHERE key = ?', (key, ))
+        total -= size
+        with self._lock:
+          self.evictions += 1
+
+  def run(self, vehicle, env, cancel=None, max_passes=100000, **options):
+    # simulate_run through the cache; a record buffer needs the steps
+    # themselves, so those runs are never cached.  cancel and max_passes
+    # only decide whether a run finishes, so they are not part of the key
+    if options.get('record') is not None:
+      return self.simulate(vehicle, env, cancel=cancel, max_passes=max_passes,
+                           **options)
+    key = run_key(vehicle, env, **options)
+    result = self.get(key)
+    if result is None:
+      result = self.simulate(vehicle, env, cancel=cancel,
+                             max_passes=max_passes, **options)
+      self.put(key, result)
+    return result
+
+  def resize(self, maxbytes):
+    self.maxbytes = maxbytes
+    self._evict(self._db())
+
+  def info(self):
+    entries, size = self._db().execute(
+      'SELECT entries, bytes FROM totals').fetchone()
+    with self._lock:
+      return ResultCacheInfo(self.hits, self.misses, self.evictions, entries,
+                             size, self.maxbytes)
+
+  def clear(self):
+    self._db().execute('DELETE FROM results')
+    with self._lock:
+      self.hits = self.misses = self.evictions = 0
@@ -0,0 +1,123 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import NamedTuple
+
+from engine import DidNotConverge
+
+
+class Busy(RuntimeError):
+  # every worker and queue slot is taken
+  pass
+
+
+class WatchdogInfo(NamedTuple):
+  completed: int
+  timeouts: int
+  budget: int
+  rejected: int
+  running: int
+
+
+class Watchdog:
+  # runs simulations off the request thread on a bounded pool: at most
+  # workers at once and queued more waiting, each with a pass budget and a
+  # wall clock timeout.  A timed out run is cancelled cooperatively (the
+  # engine looks at its cancel event every 64 passes), so its worker is
+  # soon free again
+
+  def __init__(self, workers=2, queued=8, timeout=2.0, max_passes=100000):
+    self.timeout = timeout
+    self.max_passes = max_passes
+    self._pool = ThreadPoolExecutor(workers, thread_name_prefix='watchdog')
+    self._slots = threading.BoundedSemaphore(workers + queued)
+    self._lock = threading.Lock()
+    self.completed = self.timeouts = self.budget = self.rejected = 0
+    self.running = 0
+
+  def run(self, fn, *args, timeout=None, **kwargs):
+    """Call fn(*args, cancel=..., max_passes=..., **kwargs) on the pool.
+
+    Returns what fn returns; raises DidNotConverge when the run hits its
+    pass budget or the timeout (self.timeout unless given), and Busy when
+    the pool is full.
+    """
+    if not self._slots.acquire(blocking=False):
+      with self._lock:
+        self.rejected += 1
+      raise Busy('too many runs in progress, try again')
+    cancel = threading.Event()
+    kwargs.setdefault('max_passes', self.max_passes)
+    with self._lock:
+      self.running += 1
+    try:
+      future = self._pool.submit(fn, *args, cancel=cancel, **kwargs)
+    except BaseException:
+      self._release(None)
+      raise
+    future.add_done_callback(self._release)
+    try:
+      result = future.result(self.timeout if timeout is None else timeout)
+    except TimeoutError:
+      cancel.set()
+      future.cancel()
+      with self._lock:
+        self.timeouts += 1
+      raise DidNotConverge('timeout') from None
+    except DidNotConverge:
+      with self._lock:
+        self.budget += 1
+      raise
+    with self._lock:
+      self.completed += 1
+    return result
+
+  def hold(self, timeout=None):
+    """Take a slot for a run the caller drives itself, like a stream.
+
+    Returns (cancel, release): pass cancel, a threading.Event, to the run;
+    it is set once the timeout (self.timeout unless given) passes.  Call
+    release() when the run is over.  Raises Busy when the pool is full.
+    """
+    if not self._slots.acquire(blocking=False):
+      with self._lock:
+        self.rejected += 1
+      raise Busy('too many runs in progress, try again')
+    cancel = threading.Event()
+
+    def expire():
+      with self._lock:
+        self.timeouts += 1
+      cancel.set()
+
+    timer = threading.Timer(self.timeout if timeout is None else timeout,
+                            expire)
+    timer.daemon = True
+    with self._lock:
+      self.running += 1
+    timer.start()
+    released = []
+
+    def release():
+      with self._lock:
+        if released:
+          return
+        released.append(True)
+        if not cancel.is_set():
+          self.completed += 1
+      timer.cancel()
+      self._release(None)
+
+    return cancel, release
+
+  def _release(self, future):
+    with self._lock:
+      self.running -= 1
+    self._slots.release()
+
+  def info(self):
+    with self._lock:
+      return WatchdogInfo(self.completed, self.timeouts, self.budget,
+                          self.rejected, self.running)
+
+  def shutdown(self):
+    self._pool.shutdown(wait=False, cancel_futures=True)
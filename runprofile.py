@@ -0,0 +1,58 @@
+import threading
+from time import perf_counter
+
+# simulate_run phases: setup before the step loop, the gear change (230),
+# step selection (240/250), clutch and converter (270), drag, downforce and
+# weight transfer (270), the inertia iteration (280) and the print checks
+# (300-340)
+PHASES = ('setup', 'gear', 'step', 'clutch', 'forces', 'inertia', 'prints')
+# what cut a TimeStep short at 250
+CLAMPS = ('print_interval', 'print_time', 'print_distance', 'max_step',
+          'shift_point', 'land_distance')
+
+
+class RunProfile:
+  # opt-in counters for simulate_run(profile=...): calls and seconds per
+  # phase, inertia iterations (k) per pass and TimeStep clamps by reason.
+  # Pass one profile to several runs in a thread to total them, or add()
+  # per-run profiles into a shared one
+
+  def __init__(self):
+    self.runs = self.steps = self.passes = 0
+    self.calls = dict.fromkeys(PHASES, 0)
+    self.seconds = dict.fromkeys(PHASES, 0.0)
+    self.inertia = [0] * 13  # passes that took k iterations, k = 1..12
+    self.clamps = dict.fromkeys(CLAMPS, 0)
+    self._lock = threading.Lock()
+
+  def lap(self, phase, tick):
+    # close phase, started at tick; returns the time now
+    now = perf_counter()
+    self.calls[phase] += 1
+    self.seconds[phase] += now - tick
+    return now
+
+  def add(self, other):
+    with self._lock:
+      self.runs += other.runs
+      self.steps += other.steps
+      self.passes += other.passes
+      for phase in PHASES:
+        self.calls[phase] += other.calls[phase]
+        self.seconds[phase] += other.seconds[phase]
+      for k, n in enumerate(other.inertia):
+        self.inertia[k] += n
+      for reason in CLAMPS:
+        self.clamps[reason] += other.clamps[reason]
+
+  def to_dict(self):
+    with self._lock:
+      return {
+        'runs': self.runs,
+        'steps': self.steps,
+        'passes': self.passes,
+        'calls': dict(self.calls),
+        'seconds': dict(self.seconds),
+        'inertia': {k: n for k, n in enumerate(self.inertia) if n},
+        'clamps': dict(self.clamps),
+      }
@@ -0,0 +1,391 @@
+import argparse
+import http.client
+import importlib
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+from metrics import mark_process_dead
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REFERENCE_DAT = os.path.join(HERE, 'Reference Files', 'PROSTOCK.dat')
+# handed across the re-exec of a graceful reload
+LISTEN_FD = 'RSA_LISTEN_FD'
+OLD_WORKERS = 'RSA_OLD_WORKERS'
+# the directory the workers' metrics are shared through (see app.py)
+METRICS_DIR = 'METRICS_DIR'
+_METRICS_PREFIX = 'rsa-metrics-'
+
+# run once in the parent, after the app is imported and before any worker
+# forks, so what they load or fill is shared copy-on-write
+WARM_UP_HOOKS = []
+
+
+def warm_up_hook(fn):
+  WARM_UP_HOOKS.append(fn)
+  return fn
+
+
+@warm_up_hook
+def prime(app):
+  # compile every template, and run the reference PROSTOCK setup through
+  # the atmosphere and result caches and the ensemble kernel (numpy)
+  from app import result_cache
+  from atmosphere import atmosphere_cache
+  from ensemble import simulate_ensemble
+  from specs import load_dat
+  # the form routes import these on first use; load them once for every
+  # worker instead
+  for name in ('forms', 'email_validator'):
+    importlib.import_module(name)
+  for name in app.jinja_env.list_templates():
+    app.jinja_env.get_template(name)
+  vehicle, env = load_dat(REFERENCE_DAT)
+  atmosphere_cache(env.gc_Temperature, env.gc_Humidity, env.gc_Barometer)
+  result_cache.run(vehicle, env)
+  simulate_ensemble(vehicle, [env])
+
+
+def share_metrics(fresh):
+  # METRICS_DIR, or a new temporary directory; set before the app is
+  # imported.  A fresh start empties it, a graceful reload keeps it so the
+  # counters carry on
+  directory = os.environ.get(METRICS_DIR)
+  if not directory:
+    directory = tempfile.mkdtemp(prefix=_METRICS_PREFIX)
+    os.environ[METRICS_DIR] = directory
+  elif fresh:
+    os.makedirs(directory, exist_ok=True)
+    for entry in os.scandir(directory):
+      if entry.name.endswith('.db'):
+        os.remove(entry.path)
+  return directory
+
+
+def unshare_metrics(directory):
+  # a temporary directory from share_metrics goes when the server stops
+  if os.path.basename(directory).startswith(_METRICS_PREFIX):
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def preload(warm_up=True):
+  from app import app
+  if warm_up:
+    for hook in WARM_UP_HOOKS:
+      hook(app)
+  return app
+
+
+def default_workers():
+  # cores this process may run on, which can be fewer than the host has
+  if hasattr(os, 'sched_getaffinity'):
+    return len(os.sched_getaffinity(0))
+  return os.cpu_count() or 1
+
+
+def log(message):
+  print(f'[serve {os.getpid()}] {message}', file=sys.stderr, flush=True)
+
+
+def _worker(app, sock, host, access_log):
+  # serve on the inherited socket until SIGTERM, then finish the requests
+  # in flight and exit
+  from werkzeug.serving import make_server, WSGIRequestHandler
+  from app import run_guard
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+  signal.signal(signal.SIGHUP, signal.SIG_IGN)
+  stop = threading.Event()
+  signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+  class Handler(WSGIRequestHandler):
+    def log_request(self, *args):
+      if access_log:
+        super().log_request(*args)
+
+  server = make_server(host, sock.getsockname()[1], app, threaded=True,
+                       request_handler=Handler, fd=sock.fileno())
+  server.daemon_threads = False
+  server.block_on_close = True
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  parent = os.getppid()
+  # an orphaned worker stops too
+  while not stop.wait(1) and os.getppid() == parent:
+    pass
+  server.shutdown()
+  server.server_close()
+  run_guard.shutdown()
+
+
+class Master:
+  """Pre-forking server for the preloaded app.
+
+  The parent holds the listening socket and keeps workers processes
+  running, each a threaded WSGI server accepting on it.  SIGTERM/SIGINT
+  stop the workers gracefully (SIGKILL after grace seconds); SIGHUP
+  reloads: the parent checks the new code imports, re-execs itself with
+  the socket still open, preloads and warms up again, then starts the new
+  workers and stops the old ones, so no connection is refused.  The
+  workers share their metrics through METRICS_DIR, so /metrics reports
+  the totals of all of them whichever one a scrape reaches.
+  """
+
+  def __init__(self, app, sock, host, workers, grace=30.0, access_log=False):
+    self.app = app
+    self.sock = sock
+    self.host = host
+    self.count = workers
+    self.grace = grace
+    self.access_log = access_log
+    self.workers = set()
+    self.stopping = self.reloading = False
+    self.metrics_dir = os.environ.get(METRICS_DIR)
+
+  def spawn(self):
+    pid = os.fork()
+    if pid == 0:
+      status = 1
+      try:
+        _worker(self.app, self.sock, self.host, self.access_log)
+        status = 0
+      finally:
+        os._exit(status)
+    self.workers.add(pid)
+
+  def reap(self):
+    while True:
+      try:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+      except ChildProcessError:
+        return
+      if pid == 0:
+        return
+      if self.metrics_dir:
+        mark_process_dead(self.metrics_dir, pid)
+      if pid in self.workers:
+        self.workers.discard(pid)
+        if not self.stopping:
+          log(f'worker {pid} exited with status {status}, restarting')
+
+  def stop(self, pids):
+    for pid in pids:
+      try:
+        os.kill(pid, signal.SIGTERM)
+      except ProcessLookupError:
+        pass
+
+  def reload(self):
+    self.reloading = False
+    check = subprocess.run([sys.executable, '-c', 'import app'], cwd=HERE)
+    if check.returncode:
+      log('reload aborted: the app does not import')
+      return
+    log('reloading')
+    os.set_inheritable(self.sock.fileno(), True)
+    env = dict(os.environ)
+    env[LISTEN_FD] = str(self.sock.fileno())
+    env[OLD_WORKERS] = ','.join(str(pid) for pid in self.workers)
+    os.execve(sys.executable, [sys.executable] + sys.argv, env)
+
+  def run(self, old_workers=()):
+    def on_stop(*_):
+      self.stopping = True
+
+    def on_reload(*_):
+      self.reloading = True
+
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+    signal.signal(signal.SIGHUP, on_reload)
+    log(f'serving on {self.host}:{self.sock.getsockname()[1]} '
+        f'with {self.count} workers')
+    # the workers of the process this one was re-exec'd from are still
+    # children of this pid; they stop once the new ones are up
+    old = set(old_workers)
+    while not self.stopping:
+      self.reap()
+      if self.reloading:
+        self.reload()
+      missing = self.count - len(self.workers)
+      for _ in range(missing):
+        self.spawn()
+      if old:
+        self.stop(old)
+        old = set()
+      # a worker that dies at once is not restarted in a tight loop
+      time.sleep(1 if missing and missing == self.count else 0.1)
+
+    self.stop(self.workers)
+    deadline = time.monotonic() + self.grace
+    while self.workers and time.monotonic() < deadline:
+      self.reap()
+      time.sleep(0.05)
+    for pid in self.workers:
+      os.kill(pid, signal.SIGKILL)
+    self.workers.clear()
+    log('stopped')
+
+
+def listen(host, port):
+  # the socket a graceful reload handed over, or a new one
+  fd = os.environ.pop(LISTEN_FD, None)
+  old = os.environ.pop(OLD_WORKERS, '')
+  old = [int(pid) for pid in old.split(',') if pid]
+  if fd is not None:
+    return socket.socket(fileno=int(fd)), old
+  family = socket.AF_INET6 if ':' in host else socket.AF_INET
+  return socket.create_server((host, port), family=family, backlog=2048), old
+
+
+class LoadResult(NamedTuple):
+  requests: int
+  errors: int
+  seconds: float
+  rate: float
+  # latency percentiles, seconds
+  p50: float
+  p90: float
+  p99: float
+  max: float
+
+
+def _requests(n):
+  # a mix of pages and API calls; the Quarter Pro runs cycle through 40
+  # track temperatures, so most hit the result cache after the first pass
+  from specs import load_dat
+  vehicle, env = load_dat(REFERENCE_DAT)
+  vehicle = vehicle.to_dict()
+  for i in range(n):
+    kind = i % 4
+    if kind == 0:
+      yield 'GET', '/', None
+    elif kind == 1:
+      yield 'GET', '/weatherstation', None
+    elif kind == 2:
+      yield 'POST', '/api/v1/weather', [{
+        'gc_Temperature': 50 + i % 50,
+        'gc_Humidity': 40,
+        'gc_Barometer': 29.92
+      }]
+    else:
+      item = {'vehicle': vehicle,
+              'env': env.replace(gc_TrackTemp=80 + i % 40).to_dict()}
+      yield 'POST', '/api/v1/quarterpro', [item]
+
+
+def load_run(url, requests=1000, concurrency=16, timeout=30):
+  """Send requests to the server at url, concurrency at a time.
+
+  Errors are connection failures and 5xx answers; the mix is pages,
+  /api/v1/weather and /api/v1/quarterpro runs.
+  """
+  parts = urlsplit(url)
+  local = threading.local()
+
+  def send(item):
+    method, path, payload = item
+    body = headers = None
+    if payload is not None:
+      body = json.dumps(payload)
+      headers = {'Content-Type': 'application/json'}
+    start = time.perf_counter()
+    try:
+      if getattr(local, 'conn', None) is None:
+        local.conn = http.client.HTTPConnection(parts.hostname, parts.port,
+                                                timeout=timeout)
+      local.conn.request(method, path, body, headers or {})
+      response = local.conn.getresponse()
+      response.read()
+      ok = response.status < 500
+    except (OSError, http.client.HTTPException):
+      local.conn.close()
+      local.conn = None
+      ok = False
+    return time.perf_counter() - start, ok
+
+  start = time.perf_counter()
+  with ThreadPoolExecutor(concurrency) as pool:
+    results = list(pool.map(send, _requests(requests)))
+  seconds = time.perf_counter() - start
+  latency = sorted(t for t, _ in results)
+
+  def pct(p):
+    return latency[min(len(latency) - 1, int(p / 100 * len(latency)))]
+
+  return LoadResult(len(results), sum(not ok for _, ok in results), seconds,
+                    len(results) / seconds, pct(50), pct(90), pct(99),
+                    latency[-1])
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description='Serve the app on pre-forked worker processes.')
+  parser.add_argument('--host', default='0.0.0.0')
+  parser.add_argument('--port', type=int,
+                      default=int(os.environ.get('PORT', 5000)))
+  parser.add_argument('--workers', type=int, default=default_workers())
+  parser.add_argument('--grace', type=float, default=30,
+                      help='seconds workers get to finish on shutdown')
+  parser.add_argument('--no-warm-up', dest='warm_up', action='store_false')
+  parser.add_argument('--access-log', action='store_true')
+  parser.add_argument('--load', action='store_true',
+                      help='start a local server, run a load test against '
+                      'it and stop')
+  parser.add_argument('--url', help='run the load test against this server '
+                      'instead')
+  parser.add_argument('--requests', type=int, default=1000)
+  parser.add_argument('--concurrency', type=int, default=16)
+  args = parser.parse_args(argv)
+
+  if args.load and args.url:
+    result = load_run(args.url, args.requests, args.concurrency)
+  elif args.load:
+    directory = share_metrics(True)
+    sock, _ = listen('127.0.0.1', 0)
+    start = time.perf_counter()
+    app = preload(args.warm_up)
+    log(f'preloaded in {time.perf_counter() - start:.2f} s')
+    pid = os.fork()
+    if pid == 0:
+      status = 1
+      try:
+        Master(app, sock, '127.0.0.1', args.workers, args.grace).run()
+        status = 0
+      finally:
+        os._exit(status)
+    try:
+      result = load_run(f'http://127.0.0.1:{sock.getsockname()[1]}',
+                        args.requests, args.concurrency)
+    finally:
+      os.kill(pid, signal.SIGTERM)
+      os.waitpid(pid, 0)
+      unshare_metrics(directory)
+  else:
+    directory = share_metrics(LISTEN_FD not in os.environ)
+    sock, old = listen(args.host, args.port)
+    start = time.perf_counter()
+    app = preload(args.warm_up)
+    log(f'preloaded in {time.perf_counter() - start:.2f} s')
+    Master(app, sock, args.host, args.workers, args.grace,
+           args.access_log).run(old)
+    unshare_metrics(directory)
+    return
+
+  for name, value in result._asdict().items():
+    print(f'{name}: {value:.4g}' if isinstance(value, float) else
+          f'{name}: {value}')
+  if result.errors:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,177 @@
+import argparse
+import multiprocessing
+import os
+from typing import NamedTuple
+
+from engine import simulate_run, DidNotConverge
+from rerun import resume_point
+from specs import load_dat
+
+# per worker process, set once by the pool initializer
+_base = None
+
+
+class ShiftOptimum(NamedTuple):
+  shift_rpm: tuple
+  gear_ratio: float
+  # ET at dist for the best setup found
+  et: float
+  dist: float
+  evaluations: int
+  # integration steps run, and steps skipped by resuming from checkpoints
+  steps: int
+  reused_steps: int
+  passes: int
+  converged: bool
+
+
+def _init(vehicle, env, dist):
+  global _base
+  _base = (vehicle, env, dist)
+
+
+def _evaluate(task):
+  # (shift RPMs, gear ratio, checkpoint or None) -> (ET, steps run,
+  # checkpoints taken after the resume point)
+  vehicle, env, dist = _base
+  shift_rpm, gear_ratio, resume = task
+  checkpoints = []
+  skipped = resume.steps if resume is not None else 0
+  try:
+    result = simulate_run(
+      vehicle.replace(gc_ShiftRPM=shift_rpm, gc_GearRatio=gear_ratio), env,
+      checkpoints=checkpoints, resume=resume)
+  except DidNotConverge as e:
+    # a candidate that diverges just loses
+    return float('inf'), max(e.steps - skipped, 0), []
+  et = next((p.time for p in result.points if p.dist == dist), float('inf'))
+  return et, result.steps - skipped, checkpoints
+
+
+def optimize_shifts(vehicle, env, dist=1320, step=200, min_step=10, width=2,
+                    gear_ratio=None, ratio_step=0.1, max_passes=20,
+                    processes=None):
+  """Search the shift RPMs (and gc_GearRatio) for the lowest ET at dist.
+
+  A pattern search: each pass tries width steps either side of every
+  shift RPM in turn, then of the gear ratio if gear_ratio gives its
+  (low, high) range, keeping any improvement.  Steps (step RPM, and
+  ratio_step for the gear ratio) halve after a pass without one, until the
+  RPM step is under min_step.  Candidates for one coordinate run
+  in parallel, and those for shift 2 and up resume from the current best
+  run's checkpoint at the start of that gear instead of from the line.
+  Shift RPMs are whole RPMs kept within the engine curve and above the
+  launch and stall RPMs; gear ratios are kept to 2 decimals, as QUARTER Pro
+  enters them.  A candidate whose run does not converge scores inf.
+  """
+  if dist not in (30, 60, 330, 594, 660, 1000, 1254, 1320):
+    raise ValueError(f'dist must be a print distance, not {dist!r}')
+  rpm_low = max(vehicle.gc_EngineRPM[0], vehicle.gc_LaunchRPM,
+                vehicle.gc_SlipStallRPM)
+  rpm_high = vehicle.gc_EngineRPM[-1]
+  if rpm_low > rpm_high:
+    raise ValueError('launch and stall RPMs are past the engine curve')
+  shift_rpm = [
+    min(max(x, rpm_low), rpm_high)
+    for x in vehicle.gc_ShiftRPM[:len(vehicle.gc_TransGR) - 1]
+  ]
+  ratio = vehicle.gc_GearRatio
+  processes = processes or os.cpu_count() or 1
+  pool = None
+  if processes > 1:
+    pool = multiprocessing.Pool(processes, _init, (vehicle, env, dist))
+  else:
+    _init(vehicle, env, dist)
+  evaluations = steps = reused = 0
+
+  def run(tasks):
+    nonlocal evaluations, steps, reused
+    results = pool.map(_evaluate, tasks) if pool else list(
+      map(_evaluate, tasks))
+    evaluations += len(tasks)
+    for (_, _, resume), (_, n, _) in zip(tasks, results):
+      steps += n
+      reused += resume.steps if resume is not None else 0
+    return results
+
+  try:
+    (best, _, checkpoints), = run([(tuple(shift_rpm), ratio, None)])
+    passes = 0
+    while step >= min_step and passes < max_passes:
+      passes += 1
+      improved = False
+      for k in range(len(shift_rpm) + (gear_ratio is not None)):
+        resume = None
+        if k == len(shift_rpm):
+          (low, high), current, digits = gear_ratio, ratio, 2
+          values = [ratio + j * ratio_step * step / 200
+                    for j in range(-width, width + 1) if j]
+        else:
+          low, high, current, digits = rpm_low, rpm_high, shift_rpm[k], 0
+          values = [shift_rpm[k] + j * step
+                    for j in range(-width, width + 1) if j]
+        # clamped into range at input precision, each value tried once
+        values = sorted({round(min(max(x, low), high), digits)
+                         for x in values} - {current})
+        if not values:
+          continue
+        if 0 < k < len(shift_rpm):
+          # shift k+1 only matters from the start of gear k+1; a run that
+          # ends before then does not depend on it at all
+          trial = list(shift_rpm)
+          trial[k] = values[0]
+          resume = resume_point(checkpoints,
+                                vehicle.replace(gc_ShiftRPM=shift_rpm), env,
+                                vehicle.replace(gc_ShiftRPM=trial), env)
+          if resume is None or resume.gear < k + 1:
+            continue
+        tasks = []
+        for x in values:
+          trial = list(shift_rpm)
+          if k == len(shift_rpm):
+            tasks.append((tuple(trial), x, None))
+          else:
+            trial[k] = x
+            tasks.append((tuple(trial), ratio, resume))
+        results = run(tasks)
+        i = min(range(len(results)), key=lambda i: results[i][0], default=None)
+        if i is None or results[i][0] >= best:
+          continue
+        best, _, later = results[i]
+        shift_rpm, ratio = list(tasks[i][0]), tasks[i][1]
+        if resume is not None:
+          later = checkpoints[:checkpoints.index(resume) + 1] + later
+        checkpoints = later
+        improved = True
+      if not improved:
+        step /= 2
+  finally:
+    if pool:
+      pool.close()
+      pool.join()
+
+  return ShiftOptimum(tuple(shift_rpm), ratio, best, dist, evaluations, steps,
+                      reused, passes, step < min_step)
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description='Find the QUARTER Pro shift points with the lowest ET.')
+  parser.add_argument('dat', help='QUARTER Pro .DAT vehicle file')
+  parser.add_argument('--dist', type=int, default=1320,
+                      help='print distance to minimize ET at')
+  parser.add_argument('--gear-ratio', type=float, nargs=2,
+                      metavar=('LOW', 'HIGH'), help='also search gc_GearRatio')
+  parser.add_argument('--step', type=float, default=200)
+  parser.add_argument('--processes', type=int, default=None)
+  args = parser.parse_args(argv)
+
+  vehicle, env = load_dat(args.dat)
+  best = optimize_shifts(vehicle, env, args.dist, args.step,
+                         gear_ratio=args.gear_ratio, processes=args.processes)
+  for name, value in best._asdict().items():
+    print(f'{name}: {value}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,293 @@
+import json
+import math
+import re
+
+from atmosphere import PRESS_CORRECTED, PRESS_ALTIMETER, PRESS_BAROMETER
+
+Z6 = (60 / (2 * math.pi)) * 550
+# DECLARES.BAS PI, used where a tire rollout is turned into a diameter
+PI = 3.141593
+# gc_TireDia values in this range are a rollout (circumference), as in
+# QTRPERF.BAS's MinVal_Alternate / MaxVal_Alternate
+ROLLOUT_RANGE = (61, 500)
+
+
+class _Spec:
+  # frozen, hashable record; subclasses list (name, default, coerce) in _FIELDS
+  __slots__ = ('_hash', )
+  _FIELDS = ()
+
+  def __init__(self, **values):
+    for name, default, coerce in self._FIELDS:
+      value = values.pop(name, default)
+      if value is None:
+        raise ValueError(f'{name} is required')
+      try:
+        value = coerce(value)
+      except (TypeError, ValueError):
+        raise ValueError(f'{name}: invalid value {value!r}') from None
+      object.__setattr__(self, name, value)
+    if values:
+      raise ValueError(f'unknown field(s): {", ".join(sorted(values))}')
+    self._validate()
+    object.__setattr__(self, '_hash', hash(self.astuple()))
+
+  def __setattr__(self, name, value):
+    raise AttributeError(f'{type(self).__name__} is frozen')
+
+  def __delattr__(self, name):
+    raise AttributeError(f'{type(self).__name__} is frozen')
+
+  def __eq__(self, other):
+    if type(other) is not type(self):
+      return NotImplemented
+    return self.astuple() == other.astuple()
+
+  def __hash__(self):
+    return self._hash
+
+  def __repr__(self):
+    args = ', '.join(f'{name}={getattr(self, name)!r}'
+                     for name, _, _ in self._FIELDS)
+    return f'{type(self).__name__}({args})'
+
+  def __reduce__(self):
+    return (_rebuild, (type(self), self.astuple()))
+
+  def _validate(self):
+    pass
+
+  def astuple(self):
+    return tuple(getattr(self, name) for name, _, _ in self._FIELDS)
+
+  def to_dict(self):
+    return {
+      name: list(value) if type(value) is tuple else value
+      for (name, _, _), value in zip(self._FIELDS, self.astuple())
+    }
+
+  def to_json(self):
+    return json.dumps(self.to_dict())
+
+  def replace(self, **changes):
+    values = dict(zip((name for name, _, _ in self._FIELDS), self.astuple()))
+    values.update(changes)
+    return type(self)(**values)
+
+  @classmethod
+  def from_dict(cls, values):
+    return cls(**values)
+
+  @classmethod
+  def from_json(cls, text):
+    return cls.from_dict(json.loads(text))
+
+  @classmethod
+  def from_form(cls, form):
+    values = {}
+    for name, _, coerce in cls._FIELDS:
+      if coerce is _floats:
+        # gc_EngineRPM -> gc_EngineRPM_1, gc_EngineRPM_2, ...
+        values[name] = [
+          field.data for field in form if field.name.startswith(name + '_')
+        ]
+      elif name in form:
+        values[name] = form[name].data
+    return cls(**values)
+
+
+def tire_diameter(value):
+  # QUARTER Pro takes the tire as a diameter or a rollout and tells them
+  # apart by range (CVALUE.CLS TestUnit); TIMESLIP.FRM divides a rollout
+  # by PI
+  low, high = ROLLOUT_RANGE
+  return value / PI if low <= value <= high else value
+
+
+def _rebuild(cls, values):
+  return cls(**dict(zip((name for name, _, _ in cls._FIELDS), values)))
+
+
+def _float(value):
+  value = float(value)
+  if not math.isfinite(value):
+    raise ValueError(value)
+  return value
+
+
+def _floats(values):
+  # tables stop at the first empty/zero entry, like the VB6 input grids
+  if isinstance(values, str):
+    raise ValueError(values)
+  table = []
+  for value in values:
+    if value is None or value == '' or float(value) == 0:
+      break
+    table.append(_float(value))
+  return tuple(table)
+
+
+def _bool(value):
+  if isinstance(value, str):
+    return value.strip().upper() in ('Y', 'YES', 'TRUE', '1', 'ON')
+  return bool(value)
+
+
+class VehicleSpec(_Spec):
+  _FIELDS = (
+    ('gc_Weight', 2355, _float),
+    ('gc_Wheelbase', 107, _float),
+    ('gc_Rollout', 9, _float),
+    ('gc_Overhang', 40, _float),
+    ('gc_GearRatio', 4.86, _float),
+    ('gc_Efficiency', 0.975, _float),
+    ('gc_TireDia', 102.5 / PI, _float),
+    ('gc_TireWidth', 17, _float),
+    ('gc_FuelSystem', 1, int),
+    ('gc_HPTQMult', 1, _float),
+    ('gc_RefArea', 24, _float),
+    ('gc_DragCoef', 0.24, _float),
+    ('gc_LiftCoef', 0.24, _float),
+    ('gc_TransType', 92, int),
+    ('gc_LaunchRPM', 3500, _float),
+    ('gc_SlipStallRPM', 4500, _float),
+    ('gc_Slippage', 1.004, _float),
+    ('gc_LockUp', False, _bool),
+    ('gc_TorqueMult', 1.6, _float),
+    ('gc_EnginePMI', 1, _float),
+    ('gc_TransPMI', 1, _float),
+    ('gc_TiresPMI', 1, _float),
+    ('gc_EngineRPM', None, _floats),
+    ('gc_EngineHP', None, _floats),
+    ('gc_EngineTQ', (), _floats),
+    ('gc_TransGR', None, _floats),
+    ('gc_TransEff', None, _floats),
+    ('gc_ShiftRPM', (), _floats),
+  )
+  __slots__ = tuple(name for name, _, _ in _FIELDS)
+
+  # gc_TireDia is a diameter (in).  What comes from outside, the form, a
+  # dict or JSON and .DAT files, may give a rollout instead, like QUARTER
+  # Pro's tire box; tire_diameter() turns it into a diameter there
+
+  @classmethod
+  def from_dict(cls, values):
+    spec = super().from_dict(values)
+    return spec.replace(gc_TireDia=tire_diameter(spec.gc_TireDia))
+
+  @classmethod
+  def from_form(cls, form):
+    spec = super().from_form(form)
+    return spec.replace(gc_TireDia=tire_diameter(spec.gc_TireDia))
+
+  def _validate(self):
+    for name in ('gc_Weight', 'gc_Wheelbase', 'gc_GearRatio', 'gc_Efficiency',
+                 'gc_TireDia', 'gc_TireWidth', 'gc_HPTQMult', 'gc_Slippage',
+                 'gc_TorqueMult', 'gc_LaunchRPM', 'gc_SlipStallRPM'):
+      if getattr(self, name) <= 0:
+        raise ValueError(f'{name} must be greater than zero')
+    if self.gc_TransType not in (92, 100):
+      raise ValueError('gc_TransType must be 92 (converter) or 100 (clutch)')
+    if not 1 <= self.gc_FuelSystem <= 9:
+      raise ValueError('gc_FuelSystem must be 1 - 9')
+
+    rpm = self.gc_EngineRPM
+    if len(rpm) < 2:
+      raise ValueError('gc_EngineRPM needs at least two points')
+    if any(b <= a for a, b in zip(rpm, rpm[1:])):
+      raise ValueError('gc_EngineRPM must be increasing')
+    if len(self.gc_EngineHP) != len(rpm):
+      raise ValueError('gc_EngineHP must have one value per gc_EngineRPM')
+    if not self.gc_EngineTQ:
+      # torque from HP when only the HP curve was given (as in DAT files)
+      object.__setattr__(self, 'gc_EngineTQ',
+                         tuple(Z6 * hp / x
+                               for x, hp in zip(rpm, self.gc_EngineHP)))
+    elif len(self.gc_EngineTQ) != len(rpm):
+      raise ValueError('gc_EngineTQ must have one value per gc_EngineRPM')
+
+    ngr = len(self.gc_TransGR)
+    if ngr < 1:
+      raise ValueError('gc_TransGR needs at least one gear')
+    if len(self.gc_TransEff) != ngr:
+      raise ValueError('gc_TransEff must have one value per gc_TransGR')
+    if len(self.gc_ShiftRPM) < ngr - 1:
+      raise ValueError('gc_ShiftRPM needs a shift point for every gear '
+                       'but the last')
+
+
+class RunConditions(_Spec):
+  _FIELDS = (
+    ('gc_Temperature', 75, _float),
+    ('gc_Humidity', 55, _float),
+    ('gc_Barometer', 29.92, _float),
+    ('gc_Altimeter', 32, _float),
+    ('gc_WindSpeed', 5, _float),
+    ('gc_WindAngle', 135, _float),
+    ('gc_TrackTemp', 105, _float),
+    ('gc_TractionIndex', 3, _float),
+    # atmosphere.PRESS_*: how gc_Barometer and gc_Altimeter give pressure
+    ('gc_PressType', PRESS_CORRECTED, int),
+  )
+  __slots__ = tuple(name for name, _, _ in _FIELDS)
+
+  def _validate(self):
+    if not 0 <= self.gc_Humidity <= 100:
+      raise ValueError('gc_Humidity must be 0 - 100')
+    if self.gc_Barometer <= 0:
+      raise ValueError('gc_Barometer must be greater than zero')
+    if self.gc_PressType not in (PRESS_CORRECTED, PRESS_ALTIMETER,
+                                 PRESS_BAROMETER):
+      raise ValueError('gc_PressType must be 0 - 2')
+
+
+def load_dat(path):
+  # read a QUARTER Pro .DAT file (MDI.FRM mnuFileOpen) into a spec pair
+  with open(path, encoding='latin-1') as f:
+    tokens = re.findall(r'"[^"]*"|[^\s,]+', f.read())
+  tokens.reverse()
+
+  def take(n=1):
+    values = [tokens.pop().strip('"').strip() for _ in range(n)]
+    return values if n > 1 else values[0]
+
+  def nums(n):
+    return [float(x) for x in take(n)]
+
+  ver = float(take())
+  take()  # note
+  alt, degf, pbar, rh, trkt, wt, wb, roll = nums(8)
+  if trkt < degf:
+    trkt = degf + 30  # for old data files
+  if ver == 3.21:
+    over, area, cd, cl = nums(4)
+  else:
+    over = 12
+    area, cd, cl = nums(3)
+  npts = 10 if ver == 3 else 11
+  xrpm = nums(npts)
+  yhp = nums(npts)
+  enge, ftype = nums(2)
+  tgr = nums(6)
+  tgeff = nums(6)
+  shift = nums(6)
+  launch, stall, tmult, cslip = nums(4)
+  lockup = take()
+  rgr, rge, td, tw, ti = nums(5)
+  epmoi, tpmoi, rpmoi = nums(3)
+  wind, wang = nums(2)
+
+  vehicle = VehicleSpec(
+    gc_Weight=wt, gc_Wheelbase=wb, gc_Rollout=roll, gc_Overhang=over,
+    gc_GearRatio=rgr, gc_Efficiency=rge, gc_TireDia=tire_diameter(td),
+    gc_TireWidth=tw, gc_FuelSystem=ftype, gc_HPTQMult=enge, gc_RefArea=area,
+    gc_DragCoef=cd, gc_LiftCoef=cl, gc_TransType=100 if tmult == 1 else 92,
+    gc_LaunchRPM=launch, gc_SlipStallRPM=stall, gc_Slippage=cslip,
+    gc_LockUp=lockup != 'N', gc_TorqueMult=tmult, gc_EnginePMI=epmoi,
+    gc_TransPMI=tpmoi, gc_TiresPMI=rpmoi, gc_EngineRPM=xrpm, gc_EngineHP=yhp,
+    gc_TransGR=tgr, gc_TransEff=tgeff[:len(_floats(tgr))],
+    gc_ShiftRPM=shift[:len(_floats(tgr))])
+  env = RunConditions(gc_Temperature=degf, gc_Humidity=rh, gc_Barometer=pbar,
+                      gc_Altimeter=alt, gc_WindSpeed=wind, gc_WindAngle=wang,
+                      gc_TrackTemp=trkt, gc_TractionIndex=ti)
+  return vehicle, env
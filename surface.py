@@ -0,0 +1,357 @@
+import argparse
+import itertools
+import json
+import mmap
+import multiprocessing
+import os
+import random
+import struct
+from bisect import bisect_right
+
+from atmosphere import atmosphere_cache
+from engine import simulate_run
+from resultcache import engine_version
+from specs import load_dat
+from sweep import frange
+
+# table axes, in storage order; hpc stands in for all the weather readings
+AXES = ('hpc', 'gc_TrackTemp', 'gc_TractionIndex', 'gc_Weight')
+# one value per TIMESLIP entry: 60', 330', 1/8, 1/8 MPH, 1000', 1/4, 1/4 MPH
+OUTPUTS = ('t60', 't330', 'et8', 'mph8', 't1000', 'et4', 'mph4')
+Z5 = 3600 / 5280
+MAGIC = b'RSASURF1'
+
+# per worker process, set once by the pool initializer
+_base = None
+
+
+def _nearest(at, hpc, lo, hi):
+  # the whole step in lo..hi at which at(step), rising with the step, is
+  # nearest hpc, by bisection; None when hpc is out of reach
+  if not at(lo) <= hpc <= at(hi):
+    return None
+  while hi - lo > 1:
+    mid = (lo + hi) // 2
+    if at(mid) < hpc:
+      lo = mid
+    else:
+      hi = mid
+  return min((lo, hi), key=lambda step: abs(at(step) - hpc))
+
+
+def _hpc(env, gc_FuelSystem, gc_Temperature=None, gc_Barometer=None):
+  # hpc through atmosphere_cache, on the readings simulate_run rounds to
+  if gc_Temperature is None:
+    gc_Temperature = env.gc_Temperature
+  if gc_Barometer is None:
+    gc_Barometer = env.gc_Barometer
+  return atmosphere_cache(gc_Temperature, env.gc_Humidity, gc_Barometer,
+                          env.gc_Altimeter, gc_FuelSystem, env.gc_PressType)[1]
+
+
+def _temperature_for_hpc(hpc, env, gc_FuelSystem):
+  # the 0 - 160 F temperature, in the 0.1 F steps simulate_run rounds it to,
+  # at which env's other readings give the hpc nearest to hpc; None when
+  # out of reach (hpc rises with temperature)
+  tenths = _nearest(lambda t: _hpc(env, gc_FuelSystem, t / 10), hpc, 0, 1600)
+  return None if tenths is None else tenths / 10
+
+
+def weather_for_hpc(hpc, env, gc_FuelSystem):
+  # env with readings giving the hpc nearest to hpc: the temperature at
+  # env's humidity, barometer and altimeter, or past 0 - 160 F the
+  # barometer as well, at 0.01 inHg steps from 20 to 32 inHg (hpc falls as
+  # it rises)
+  temperature = _temperature_for_hpc(hpc, env, gc_FuelSystem)
+  if temperature is not None:
+    return env.replace(gc_Temperature=temperature)
+  temperature = 0.0 if hpc < _hpc(env, gc_FuelSystem, 0.0) else 160.0
+  step = _nearest(
+    lambda i: _hpc(env, gc_FuelSystem, temperature, (3200 - i) / 100), hpc,
+    0, 1200)
+  if step is None:
+    raise ValueError(f'hpc {hpc} is out of reach at {env.gc_Humidity} % RH')
+  return env.replace(gc_Temperature=temperature,
+                     gc_Barometer=(3200 - step) / 100)
+
+
+def default_axes(vehicle, env):
+  # the axes other than hpc around the vehicle's own setup: track
+  # temperature every 5 F over +/- 20 F with a point at 100 F, where its
+  # effect changes, traction index every 0.5 over +/- 1 and weight every
+  # 50 lb over +/- 100 lb
+  track = {env.gc_TrackTemp + 5 * i for i in range(-4, 5)}
+  if min(track) < 100 < max(track):
+    track.add(100.0)
+  return {
+    'gc_TrackTemp': sorted(track),
+    'gc_TractionIndex': [env.gc_TractionIndex + 0.5 * i for i in range(-2, 3)],
+    'gc_Weight': [vehicle.gc_Weight + 50 * i for i in range(-2, 3)],
+  }
+
+
+def _init(vehicle, env):
+  global _base
+  _base = (vehicle, env)
+
+
+def _timeslip(result):
+  # TIMESLIP from the print rows: the same values, but QUARTER Pro leaves an
+  # entry 0 when its print lands on a gear change step just past it, which
+  # would wreck the interpolation around that grid point
+  t = {p.dist: p.time for p in result.points}
+  return (t[60], t[330], t[660], Z5 * 66 / (t[660] - t[594]), t[1000],
+          t[1320], Z5 * 66 / (t[1320] - t[1254]))
+
+
+def _run(point):
+  # one grid point (in AXES order) -> TIMESLIP
+  vehicle, env = _base
+  hpc, track_temp, traction, weight = point
+  env = weather_for_hpc(hpc, env, vehicle.gc_FuelSystem).replace(
+    gc_TrackTemp=track_temp, gc_TractionIndex=traction)
+  return _timeslip(simulate_run(vehicle.replace(gc_Weight=weight), env))
+
+
+def _run_readings(sample):
+  # (RunConditions fields, gc_Weight) -> TIMESLIP
+  vehicle, env = _base
+  fields, weight = sample
+  return _timeslip(
+    simulate_run(vehicle.replace(gc_Weight=weight), env.replace(**fields)))
+
+
+def _map(fn, vehicle, env, points, processes):
+  processes = processes or os.cpu_count() or 1
+  if processes == 1 or len(points) < 2:
+    _init(vehicle, env)
+    return [fn(point) for point in points]
+  chunksize = max(1, len(points) // (processes * 4))
+  with multiprocessing.Pool(processes, _init, (vehicle, env)) as pool:
+    return pool.map(fn, points, chunksize)
+
+
+def _weather_samples(vehicle, env, grid, n, rng):
+  # n real weather readings inside the table: humidity and barometer drawn
+  # from 5 - 95 % and 28.5 - 30.5 inHg, the temperature solved for an hpc
+  # drawn from the hpc axis, the other axes drawn from theirs.  At one hpc
+  # these differ in air density, so in drag, which the hpc axis leaves out
+  low, high = grid[0][0], grid[0][-1]
+  samples = []
+  for _ in range(20 * n):
+    if len(samples) == n:
+      break
+    trial = env.replace(gc_Humidity=round(rng.uniform(5, 95)),
+                        gc_Barometer=round(rng.uniform(28.5, 30.5), 2))
+    temperature = _temperature_for_hpc(rng.uniform(low, high), trial,
+                                       vehicle.gc_FuelSystem)
+    if temperature is None or not low <= _hpc(
+        trial, vehicle.gc_FuelSystem, temperature) <= high:
+      continue
+    fields = {
+      'gc_Temperature': temperature,
+      'gc_Humidity': trial.gc_Humidity,
+      'gc_Barometer': trial.gc_Barometer,
+      'gc_TrackTemp': rng.uniform(grid[1][0], grid[1][-1]),
+      'gc_TractionIndex': rng.uniform(grid[2][0], grid[2][-1]),
+    }
+    samples.append((fields, rng.uniform(grid[3][0], grid[3][-1])))
+  return samples
+
+
+def build_surface(vehicle, env, path, axes, processes=None, check=32,
+                  weather=32, seed=0):
+  """Run the engine over a grid and write it as a surface table.
+
+  axes maps each name in AXES to its increasing grid values.  Afterwards
+  check cell centers and weather real weather samples (see
+  _weather_samples), picked with seed, are run in full; the largest error
+  seen for each output is stored as the table's bound.  The samples catch
+  what hpc alone misses: the same hpc at other readings has another air
+  density.
+  """
+  if vehicle.gc_FuelSystem == 9:
+    raise ValueError('fuel system 9 has a fixed hpc')
+  grid = []
+  for name in AXES:
+    values = tuple(float(x) for x in axes[name])
+    if len(values) < 2 or any(b <= a for a, b in zip(values, values[1:])):
+      raise ValueError(f'{name} needs two or more increasing grid values')
+    grid.append(values)
+  points = list(itertools.product(*grid))
+  table = _map(_run, vehicle, env, points, processes)
+
+  # multilinear interpolation is least accurate at cell centers
+  rng = random.Random(seed)
+  cells = list(itertools.product(*(range(len(values) - 1) for values in grid)))
+  centers = [
+    tuple((values[i] + values[i + 1]) / 2 for values, i in zip(grid, cell))
+    for cell in rng.sample(cells, min(check, len(cells)))
+  ]
+  exact = _map(_run, vehicle, env, centers, processes)
+  samples = _weather_samples(vehicle, env, grid, weather, rng)
+  sampled = _map(_run_readings, vehicle, env, samples, processes)
+
+  meta = {
+    'axes': dict(zip(AXES, grid)),
+    'outputs': OUTPUTS,
+    'version': engine_version(),
+    'vehicle': vehicle.to_dict(),
+    'env': env.to_dict(),
+    'bound': [0.0] * len(OUTPUTS),
+  }
+  values = [x for row in table for x in row]
+  _write(path, meta, values)
+  surface = Surface(path)
+  try:
+    estimates = [surface(*center) for center in centers]
+    estimates += [surface.estimate(env.replace(**fields), weight)
+                  for fields, weight in samples]
+  finally:
+    surface.close()
+  bound = [0.0] * len(OUTPUTS)
+  for estimate, row in zip(estimates, exact + sampled):
+    for j, (a, b) in enumerate(zip(estimate, row)):
+      bound[j] = max(bound[j], abs(a - b))
+  meta['bound'] = bound
+  _write(path, meta, values)
+  return tuple(bound)
+
+
+def _write(path, meta, values):
+  # magic, header length, JSON header padded to 8 bytes, then float64 data
+  # in C order over AXES with OUTPUTS last
+  header = json.dumps(meta).encode()
+  header += b' ' * (-(len(MAGIC) + 4 + len(header)) % 8)
+  with open(path, 'wb') as f:
+    f.write(MAGIC + struct.pack('<I', len(header)) + header)
+    f.write(struct.pack(f'<{len(values)}d', *values))
+
+
+class Surface:
+  # a surface table file, memory mapped; calling it interpolates TIMESLIP
+  # at (hpc, gc_TrackTemp, gc_TractionIndex, gc_Weight)
+
+  def __init__(self, path):
+    with open(path, 'rb') as f:
+      if os.fstat(f.fileno()).st_size < len(MAGIC) + 4:
+        raise ValueError(f'{path} is not a surface table')
+      self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if self._map[:len(MAGIC)] != MAGIC:
+      self._map.close()
+      raise ValueError(f'{path} is not a surface table')
+    start = len(MAGIC) + 4
+    size, = struct.unpack_from('<I', self._map, len(MAGIC))
+    if start + size > len(self._map):
+      self._map.close()
+      raise ValueError(f'{path} is truncated')
+    meta = json.loads(self._map[start:start + size])
+    self.axes = tuple(tuple(meta['axes'][name]) for name in AXES)
+    self.outputs = tuple(meta['outputs'])
+    self.bound = tuple(meta['bound'])
+    self.version = meta['version']
+    if self.version != engine_version():
+      # built by other engine code, so its runs are not what simulate_run
+      # gives now
+      self._map.close()
+      raise ValueError(f'{path} was built by engine {self.version}, not '
+                       f'{engine_version()}; rebuild it')
+    self.vehicle = meta['vehicle']
+    self.env = meta['env']
+
+    # element stride of each axis
+    self._strides = []
+    stride = len(self.outputs)
+    for values in reversed(self.axes):
+      self._strides.insert(0, stride)
+      stride *= len(values)
+    if len(self._map) - start - size != 8 * stride:
+      self._map.close()
+      raise ValueError(f'{path} is truncated')
+    self._data = memoryview(self._map)[start + size:].cast('d')
+
+  def __call__(self, hpc, gc_TrackTemp, gc_TractionIndex, gc_Weight):
+    base = 0
+    fractions = []
+    for name, values, stride, x in zip(AXES, self.axes, self._strides,
+                                       (hpc, gc_TrackTemp, gc_TractionIndex,
+                                        gc_Weight)):
+      if not values[0] <= x <= values[-1]:
+        raise ValueError(f'{name} {x} is outside the table '
+                         f'({values[0]} - {values[-1]})')
+      k = min(bisect_right(values, x) - 1, len(values) - 2)
+      base += k * stride
+      fractions.append((stride, (x - values[k]) / (values[k + 1] - values[k])))
+
+    # weighted sum over the 16 corners of the cell
+    data = self._data
+    result = [0.0] * len(self.outputs)
+    for corner in itertools.product((0, 1), repeat=len(AXES)):
+      weight = 1.0
+      offset = base
+      for (stride, f), bit in zip(fractions, corner):
+        if bit:
+          weight *= f
+          offset += stride
+        else:
+          weight *= 1 - f
+      if weight:
+        for j in range(len(result)):
+          result[j] += weight * data[offset + j]
+    return tuple(result)
+
+  def estimate(self, env, gc_Weight=None):
+    # TIMESLIP for a RunConditions, hpc from its weather readings as
+    # simulate_run rounds them; within the table's bound, which covers the
+    # air density hpc leaves out
+    if gc_Weight is None:
+      gc_Weight = self.vehicle['gc_Weight']
+    return self(_hpc(env, self.vehicle['gc_FuelSystem']), env.gc_TrackTemp,
+                env.gc_TractionIndex, gc_Weight)
+
+  def close(self):
+    self._data.release()
+    self._map.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description='Build a QUARTER Pro response surface table.')
+  parser.add_argument('dat', help='QUARTER Pro .DAT vehicle file')
+  parser.add_argument('out', help='table file to write')
+  parser.add_argument('--hpc', type=frange, required=True)
+  parser.add_argument('--track-temp', type=frange, help='gc_TrackTemp values')
+  parser.add_argument('--traction', type=frange,
+                      help='gc_TractionIndex values')
+  parser.add_argument('--weight', type=frange, help='gc_Weight values')
+  parser.add_argument('--check', type=int, default=32,
+                      help='cell centers run in full for the error bound')
+  parser.add_argument('--weather', type=int, default=32,
+                      help='real weather samples run in full for the error '
+                      'bound')
+  parser.add_argument('--processes', type=int, default=None)
+  args = parser.parse_args(argv)
+
+  vehicle, env = load_dat(args.dat)
+  axes = default_axes(vehicle, env)
+  axes['hpc'] = args.hpc
+  for name, values in (('gc_TrackTemp', args.track_temp),
+                       ('gc_TractionIndex', args.traction),
+                       ('gc_Weight', args.weight)):
+    if values:
+      axes[name] = values
+  build_surface(vehicle, env, args.out, axes, args.processes, args.check,
+                args.weather)
+  with Surface(args.out) as surface:
+    for name, bound in zip(surface.outputs, surface.bound):
+      print(f'{name}: +/- {bound:.4f}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,99 @@
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import sys
+
+from engine import simulate_run
+from specs import load_dat
+
+# per worker process, set once by the pool initializer
+_base = None
+
+
+def grid(**ranges):
+  # Cartesian product of VehicleSpec/RunConditions field values, as dicts
+  names = list(ranges)
+  for values in itertools.product(*(ranges[name] for name in names)):
+    yield dict(zip(names, values))
+
+
+def frange(text):
+  # "4.10:4.90:0.05" (stop included) or "4.10,4.30,4.56"
+  if ':' not in text:
+    return [float(x) for x in text.split(',')]
+  start, stop, step = (float(x) for x in text.split(':'))
+  if step <= 0:
+    raise ValueError(f'range step must be positive: {text!r}')
+  n = int(round((stop - start) / step)) + 1
+  return [round(start + i * step, 10) for i in range(max(n, 0))]
+
+
+def _init(vehicle, env):
+  global _base
+  _base = (vehicle, env)
+
+
+def _run(changes):
+  # one grid point -> tidy rows, one per DistToPrint point reached
+  vehicle, env = _base
+  vchanges = {k: v for k, v in changes.items() if k in vehicle.__slots__}
+  echanges = {k: v for k, v in changes.items() if k not in vchanges}
+  try:
+    result = simulate_run(vehicle.replace(**vchanges), env.replace(**echanges))
+  except (ValueError, ArithmeticError, IndexError) as e:
+    return [dict(changes, error=str(e))]
+  return [
+    dict(changes, dist=p.dist, et=p.time, mph=p.mph, rpm=p.rpm, gear=p.gear)
+    for p in result.points
+  ]
+
+
+def run_sweep(vehicle, env, points, processes=None, chunksize=None):
+  # yield tidy result rows as runs complete (not in grid order)
+  points = list(points)
+  processes = processes or os.cpu_count() or 1
+  if processes == 1 or len(points) < 2:
+    _init(vehicle, env)
+    for changes in points:
+      yield from _run(changes)
+    return
+
+  if chunksize is None:
+    # a few chunks per worker amortizes IPC but keeps the load balanced
+    chunksize = max(1, len(points) // (processes * 4))
+  with multiprocessing.Pool(processes, _init, (vehicle, env)) as pool:
+    for rows in pool.imap_unordered(_run, points, chunksize):
+      yield from rows
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description='Run QUARTER Pro over a grid of gear, tire and weight.')
+  parser.add_argument('dat', help='QUARTER Pro .DAT vehicle file')
+  parser.add_argument('--gear', type=frange, help='gc_GearRatio values')
+  parser.add_argument('--tire', type=frange,
+                      help='gc_TireDia values (diameter, in)')
+  parser.add_argument('--weight', type=frange, help='gc_Weight values')
+  parser.add_argument('--processes', type=int, default=None)
+  parser.add_argument('--chunksize', type=int, default=None)
+  args = parser.parse_args(argv)
+
+  vehicle, env = load_dat(args.dat)
+  ranges = {
+    'gc_GearRatio': args.gear or [vehicle.gc_GearRatio],
+    'gc_TireDia': args.tire or [vehicle.gc_TireDia],
+    'gc_Weight': args.weight or [vehicle.gc_Weight],
+  }
+  fields = list(ranges) + ['dist', 'et', 'mph', 'rpm', 'gear', 'error']
+  out = csv.DictWriter(sys.stdout, fields)
+  out.writeheader()
+  for row in run_sweep(vehicle, env, grid(**ranges), args.processes,
+                       args.chunksize):
+    out.writerow(row)
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+  main()
@@ -1,21 +1,79 @@
 import math
 
-def tire(gc_TireWidth, TireDia, Vel, Ags0):
-  TGK = (gc_TireWidth ** 1.4 + TireDia - 16) / (0.171 * TireDia ** 1.7)
-  TireGrowth = 1 + TGK * 0.0000135 * Vel ** 1.6
-  TGLinear = 1 + TGK * 0.00035 * Vel
-  if TGLinear < TireGrowth:
+
+class TireModel:
+  # tire growth and rollout for one tire size, built once per vehicle
+  # growth: 'quarter' (QUARTER Pro) or 'bonneville' (Bonneville Pro)
+  # tabulated: look growth up in a 0 - 350 ft/s table instead of Vel ** 1.6
+
+  VMAX = 350
+  STEP = 0.5
+
+  def __init__(self, gc_TireWidth, TireDia, growth='quarter',
+               tabulated=False):
+    if growth not in ('quarter', 'bonneville'):
+      raise ValueError(f'unknown tire growth {growth!r}')
+    self.TireDia = TireDia
+    self.growth = growth
+    self.TGK = (gc_TireWidth**1.4 + TireDia - 16) / (0.171 * TireDia**1.7)
+    self.TGPow = self.TGK * 0.0000135
+    self.TGLin = self.TGK * 0.00035
+    self.CirFt = TireDia * math.pi / 12
+    self.table = None
+    if tabulated:
+      n = int(self.VMAX / self.STEP) + 1
+      self.table = [self.growth_at(i * self.STEP) for i in range(n)]
+
+  def growth_at(self, Vel):
+    if self.growth == 'bonneville':
+      return 1 + 0.00004 * Vel
+    TireGrowth = 1 + self.TGPow * Vel**1.6
+    TGLinear = 1 + self.TGLin * Vel
+    if TGLinear < TireGrowth:
       TireGrowth = TGLinear
-      
-  TireSQ = TireGrowth - 0.035 * abs(Ags0)
-  TireCirFt = TireSQ * TireDia * math.pi / 12
+    return TireGrowth
+
+  def tire_growth(self, Vel):
+    table = self.table
+    if table is None or not 0 <= Vel < self.VMAX:
+      return self.growth_at(Vel)
+    x = Vel / self.STEP
+    i = int(x)
+    return table[i] + (x - i) * (table[i + 1] - table[i])
 
-  return TireGrowth, TireCirFt
+  def __call__(self, Vel, Ags0):
+    # TireGrowth, TireCirFt at one step, as tire()
+    if self.table is not None:
+      TireGrowth = self.tire_growth(Vel)
+    elif self.growth == 'bonneville':
+      TireGrowth = 1 + 0.00004 * Vel
+    else:
+      TireGrowth = 1 + self.TGPow * Vel**1.6
+      TGLinear = 1 + self.TGLin * Vel
+      if TGLinear < TireGrowth:
+        TireGrowth = TGLinear
+    if self.growth == 'bonneville':
+      return TireGrowth, TireGrowth * self.CirFt
+    return TireGrowth, (TireGrowth - 0.035 * abs(Ags0)) * self.CirFt
 
+  def batch(self, Vel, Ags):
+    # TireGrowth, TireCirFt arrays over velocity/acceleration arrays
+    import numpy as np
+    Vel, Ags = np.broadcast_arrays(np.asarray(Vel, float),
+                                   np.asarray(Ags, float))
+    if self.growth == 'bonneville':
+      TireGrowth = 1 + 0.00004 * Vel
+      return TireGrowth, TireGrowth * self.CirFt
 
+    TireGrowth = np.minimum(1 + self.TGPow * Vel**1.6, 1 + self.TGLin * Vel)
+    if self.table is not None:
+      inside = (Vel >= 0) & (Vel < self.VMAX)
+      grid = np.arange(len(self.table)) * self.STEP
+      TireGrowth = np.where(inside, np.interp(Vel, grid, self.table),
+                            TireGrowth)
+    TireSQ = TireGrowth - 0.035 * np.abs(Ags)
+    return TireGrowth, TireSQ * self.CirFt
 
-  
 
-  # Bonneville Pro
-  # TireGrowth = 1 + 0.00004 * Vel(L)
-  # TireCirFt = TireGrowth * TireDia * math.pi / 12
+def tire(gc_TireWidth, TireDia, Vel, Ags0):
+  return TireModel(gc_TireWidth, TireDia)(Vel, Ags0)
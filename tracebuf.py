@@ -0,0 +1,83 @@
+from array import array
+
+
+class TraceBuffer:
+  # run rows (time, dist, vel, ags, slip, rpm, gear) in typed arrays,
+  # 8 bytes per float and 1 per slip flag and gear
+  # capacity doubles as rows are added; every=N keeps every Nth appended
+  # row plus all events, ring=N keeps only the newest N rows
+
+  FIELDS = ('time', 'dist', 'vel', 'ags', 'slip', 'rpm', 'gear')
+  TYPES = 'ddddbdb'
+
+  def __init__(self, capacity=64, every=1, ring=None):
+    if every < 1:
+      raise ValueError(f'every must be 1 or more, not {every!r}')
+    if ring is not None:
+      if ring < 1:
+        raise ValueError(f'ring must be 1 or more, not {ring!r}')
+      capacity = ring
+    self.every = every
+    self.ring = ring
+    self.columns = tuple(array(code, bytes(array(code).itemsize * capacity))
+                         for code in self.TYPES)
+    self.n = 0  # rows held
+    self.head = 0  # oldest row in ring mode
+    self.seen = 0  # rows offered to append()
+    self.dropped = 0  # rows overwritten in ring mode
+
+  def __len__(self):
+    return self.n
+
+  @property
+  def capacity(self):
+    return len(self.columns[0])
+
+  @property
+  def nbytes(self):
+    return sum(col.itemsize * len(col) for col in self.columns)
+
+  def reserve(self, rows):
+    # make room for rows rows, growing geometrically; the column arrays
+    # are extended in place so references to them stay valid
+    size = self.capacity
+    if rows <= size:
+      return
+    while size < rows:
+      size *= 2
+    for col in self.columns:
+      col.extend(array(col.typecode, bytes(col.itemsize * (size - len(col)))))
+
+  def append(self, row, event=False):
+    # store one row unless decimated away; returns True if kept
+    self.seen += 1
+    if not event and (self.seen - 1) % self.every:
+      return False
+    if self.ring is not None and self.n == self.ring:
+      i = self.head
+      self.head = (self.head + 1) % self.ring
+      self.dropped += 1
+    else:
+      i = self.n
+      self.reserve(i + 1)
+      self.n += 1
+    for col, value in zip(self.columns, row):
+      col[i] = value
+    return True
+
+  def clear(self):
+    self.n = self.head = self.seen = self.dropped = 0
+
+  def column(self, name):
+    # one column, oldest row first
+    col = self.columns[self.FIELDS.index(name)]
+    if self.ring is None or self.n < self.ring:
+      return col[:self.n]
+    return col[self.head:] + col[:self.head]
+
+  def __iter__(self):
+    cols = [self.column(name) for name in self.FIELDS]
+    return zip(*cols)
+
+  def to_dict(self):
+    return {name: self.column(name).tolist() for name in self.FIELDS}